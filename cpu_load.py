@@ -70,20 +70,24 @@ def apply_cpu_load_x86(load_percentage: int, stop_event: Event, modulate: bool =
 def apply_cpu_load(load_percentage: int, stop_event: Event, modulate: bool = False):
     """
     Pythonループによる負荷発生。
-    stop_event がセットされると各チャンク後にループを抜ける.
+    全コアにプロセスを1つずつ起動し、各プロセスが load_percentage(%) の
+    デューティ比で計算と休止を繰り返す.
+    stop_event がセットされると各周期後にループを抜ける.
     """
+    period = 0.1 * (2 if modulate else 1)
+    busy_time = period * max(0, min(load_percentage, 100)) / 100.0
+
     def cpu_intensive_task(stop_evt: Event):
         try:
             while not stop_evt.is_set():
-                # 計算処理を小さなチャンクに分割
-                for _ in range(5000):
-                    if stop_evt.is_set():
-                        break
+                # 周期のうち busy_time だけ計算する
+                start = time.perf_counter()
+                while time.perf_counter() - start < busy_time:
                     _ = [i * i for i in range(1000)]
-                if stop_evt.is_set():
-                    break
-                # 少し休止して他スレッドへ譲る
-                time.sleep(0.01 * (2 if modulate else 1))
+                # 残り時間は休止して他プロセスへ譲る
+                idle_time = period - (time.perf_counter() - start)
+                if idle_time > 0:
+                    time.sleep(idle_time)
         except Exception as e:
             print(f"[ERROR] Exception in cpu_intensive_task: {e}")
 
@@ -47,6 +47,8 @@ fi
 #    例: mv "$ROOT"/mixed_load/* "$TARGET/cpu_load"/
 #         mv "$ROOT"/gpu_load_cuda.py "$TARGET/gpu_load"/
 #         mv "$ROOT"/gpu_load_rocm.py "$TARGET/gpu_load"/
+#         mv "$ROOT"/vmm_alloc.py "$TARGET/gpu_load"/
+#         mv "$ROOT"/gemm_dtype.py "$TARGET/gpu_load"/
 #         mv "$ROOT"/texture.jpg "$TARGET/gpu_load"/
 #         mv "$ROOT"/nettest_config.json "$TARGET/network_test"/
 
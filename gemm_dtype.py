@@ -0,0 +1,29 @@
+"""
+行列演算 (Tensor 負荷) に使う dtype の選択。
+
+CUDA / ROCm の両バックエンドから使い、環境変数 POWERLOADER_GEMM_DTYPE
+(fp32 / fp16 / bf16) はここでだけ読む。
+"""
+import os
+
+import torch
+
+_GEMM_DTYPES = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+
+def select_gemm_dtype():
+    """
+    行列演算に使う dtype を返します。
+    POWERLOADER_GEMM_DTYPE が未指定なら、Tensor Core / マトリックスコアを使う BF16
+    (非対応 GPU では FP16) を選びます。
+    """
+    name = os.environ.get("POWERLOADER_GEMM_DTYPE", "").strip().lower()
+    if name in _GEMM_DTYPES:
+        return _GEMM_DTYPES[name]
+    if name:
+        print(f"[WARN] Unknown POWERLOADER_GEMM_DTYPE={name!r}; using default.")
+    return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
@@ -13,12 +13,19 @@ import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
+import os
 import threading
 import time
 import numpy as np
-import torch
 import sys
 
+# キャッシングアロケータの断片化を防ぐ（ユーザー指定があればそちらを優先）
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:512")
+
+import torch
+
+from gpu_load.gemm_dtype import select_gemm_dtype
+
 ######################################
 # OpenGL 用のライティング初期化
 ######################################
@@ -167,19 +174,50 @@ def apply_gpu_load(load_percentage, stop_event, gpu_id):
 ######################################
 # (2) Tensor 計算で GPU に負荷をかける (PyTorch)
 ######################################
+def _capture_matmul_graph(a, b, c, stream):
+    """
+    行列積を CUDA グラフにキャプチャして返します。
+    以降は replay() 1 回で Python 側の処理やカーネル起動のオーバーヘッドなしに再実行できます。
+    キャプチャできない環境では None を返し、呼び出し側は通常の起動に戻ります。
+    """
+    try:
+        # cuBLAS のハンドルやワークスペースの遅延初期化をキャプチャ外で済ませておく
+        with torch.cuda.stream(stream):
+            torch.matmul(a, b, out=c)
+        stream.synchronize()
+        graph = torch.cuda.CUDAGraph()
+        # VRAM 負荷や描画のスレッドが同時に CUDA を使ってもキャプチャを壊さないよう thread_local にする
+        with torch.cuda.graph(graph, stream=stream, capture_error_mode="thread_local"):
+            torch.matmul(a, b, out=c)
+        return graph
+    except RuntimeError as e:
+        print(f"[WARN] Graph capture failed on GPU {torch.cuda.current_device()}; launching matmul directly: {e}")
+        return None
+
 def tensor_calculation(load_percentage, stop_event, gpu_id):
     torch.cuda.set_device(gpu_id)
+    dtype = select_gemm_dtype()
+    n = 8000
+    # 行列はループ外で一度だけ確保し、出力先も使い回す
+    a = torch.randn((n, n), device='cuda', dtype=dtype)
+    b = torch.randn((n, n), device='cuda', dtype=dtype)
+    c = torch.empty((n, n), device='cuda', dtype=dtype)
+    stream = torch.cuda.Stream()
+    graph = _capture_matmul_graph(a, b, c, stream)
     while not stop_event.is_set():
-        a = torch.rand((8000, 8000), device='cuda')
-        b = torch.rand((8000, 8000), device='cuda')
-        _ = torch.matmul(a, b)
-        torch.cuda.synchronize()
-        time.sleep(1 / (load_percentage + 1))
+        if graph is not None:
+            graph.replay()
+        else:
+            with torch.cuda.stream(stream):
+                torch.matmul(a, b, out=c)
+        stream.synchronize()
+        stop_event.wait(1 / (load_percentage + 1))
 
 def apply_gpu_tensor_load(load_percentage, stop_event, gpu_ids):
     """
     PyTorch の Tensor 演算を使ってGPUに負荷をかけます。
     各 GPU に対して個別のスレッドを起動します。
+    dtype は POWERLOADER_GEMM_DTYPE で切り替えます (既定は BF16/FP16)。
     """
     print(f"Starting GPU Tensor Load with {load_percentage}% on GPUs: {gpu_ids}")
     for gpu_id in gpu_ids:
@@ -212,6 +250,8 @@ def apply_combined_load(load_percentage, stop_event, gpu_ids):
 ######################################
 # (4) VRAM 負荷 (動的割当)
 ######################################
+VRAM_CHUNK_ALIGN = 2 * 1024 * 1024  # 追加確保のサイズをこの単位に切り上げる
+
 def allocate_vram_dynamic(vram_percentage, stop_event, gpu_id):
     """
     ユーザーが指定したvram_percentage(%)に合わせて、VRAMを割り当て続けます。
@@ -221,39 +261,61 @@ def allocate_vram_dynamic(vram_percentage, stop_event, gpu_id):
     print(f"[INFO] Starting VRAM load on GPU {gpu_id} => target={vram_percentage}% of total memory.")
 
     allocated_tensors = []
+    # 確保は torch.empty のみで初期化せず、書き込みは既定の (最低) 優先度のストリームに限る
+    touch_stream = torch.cuda.Stream(device=device, priority=0)
+
+    # 目標量までを最初にまとめて確保し、以降はその領域を書き換えて使い続ける。
+    # 超過時に解放量を目標の 1/10 程度に抑えられるよう、1 個の巨大テンソルではなく分割して持つ
+    free_mem, total_mem = torch.cuda.mem_get_info(device=device)
+    target_bytes = int(total_mem * (vram_percentage / 100.0))
+    tolerance = total_mem // 100  # 目標との差が1%以内なら再確保しない
+    remaining = min(target_bytes - (total_mem - free_mem), free_mem)
+    initial_chunk = -(-max(target_bytes // 10, 1) // VRAM_CHUNK_ALIGN) * VRAM_CHUNK_ALIGN
+    while remaining > 0 and not stop_event.is_set():
+        size = min(initial_chunk, remaining)
+        try:
+            allocated_tensors.append(torch.empty(size, dtype=torch.uint8, device=device))
+        except RuntimeError as e:
+            print(f"[WARN] OOM on GPU {gpu_id}: {e}")
+            break
+        remaining -= size
 
     while not stop_event.is_set():
         free_mem, total_mem = torch.cuda.mem_get_info(device=device)
         used_mem = total_mem - free_mem
-        target_bytes = int(total_mem * (vram_percentage / 100.0))
-        current_alloc = used_mem
+        # 解放済みでもキャッシュに残っている分は再利用できるため使用量から除く
+        cached = torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+        current_alloc = used_mem - cached
 
-        if current_alloc < target_bytes:
+        if abs(current_alloc - target_bytes) <= tolerance:
+            # 確保済み領域を書き換えてメモリ負荷を維持する。
+            # 行列演算のストリームと競合しないよう、最低優先度の専用ストリームで行う
+            with torch.cuda.stream(touch_stream):
+                for tensor in allocated_tensors:
+                    tensor.random_()
+            touch_stream.synchronize()
+            stop_event.wait(0.2)
+        elif current_alloc < target_bytes:
             to_allocate = target_bytes - current_alloc
-            chunk_size = to_allocate // 10
-            if chunk_size < 1:
-                chunk_size = 1
-            # float32: 4バイト
-            chunk_size_float = chunk_size // 4
-            if chunk_size_float > 0:
-                try:
-                    tensor = torch.zeros(chunk_size_float, dtype=torch.float32, device=device)
-                    allocated_tensors.append(tensor)
-                except RuntimeError as e:
-                    print(f"[WARN] OOM on GPU {gpu_id}: {e}")
-                    time.sleep(1.0)
-            time.sleep(0.1)
+            # バイト単位 (uint8) で確保し、アロケータの粒度 (2 MiB) に切り上げる
+            chunk_size = max(to_allocate // 10, 4096)
+            chunk_size = -(-chunk_size // VRAM_CHUNK_ALIGN) * VRAM_CHUNK_ALIGN
+            try:
+                tensor = torch.empty(chunk_size, dtype=torch.uint8, device=device)
+                allocated_tensors.append(tensor)
+            except RuntimeError as e:
+                print(f"[WARN] OOM on GPU {gpu_id}: {e}")
+                stop_event.wait(1.0)
+            stop_event.wait(0.1)
         elif current_alloc > target_bytes:
             to_free = current_alloc - target_bytes
             freed = 0
             while freed < to_free and allocated_tensors:
                 pop_t = allocated_tensors.pop()
-                freed += pop_t.numel() * 4
+                freed += pop_t.numel()
                 del pop_t
-            torch.cuda.empty_cache()
-            time.sleep(0.1)
-        else:
-            time.sleep(0.2)
+            # empty_cache() は同期を伴い負荷が途切れるため、ループ中は呼ばずキャッシュを再利用する
+            stop_event.wait(0.1)
 
     print(f"[INFO] Stopping VRAM load on GPU {gpu_id}. Freed all allocated tensors.")
     del allocated_tensors
@@ -11,67 +11,174 @@ ROCm環境向けのGPU負荷テストモジュールです。
 """
 
 import os
-import time
 import threading
-import torch
 
 # ROCm用環境変数の設定（必要に応じて）
 os.environ["AMD_SERIALIZE_KERNEL"] = "1"   # 正しい値は 0 または 1
 os.environ["TORCH_USE_HIP_DSA"] = "1"
+# キャッシングアロケータの断片化を防ぐ（ユーザー指定があればそちらを優先）
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:512")
+
+import torch
+import torch.multiprocessing as mp
+
+from gpu_load.gemm_dtype import select_gemm_dtype
 
 # Mesaドライバのパスをシステム側のディレクトリに変更（環境に合わせて調整してください）
 os.environ["LIBGL_DRIVERS_PATH"] = "/usr/lib/x86_64-linux-gnu/dri"
 # 必要に応じてLD_LIBRARY_PATHも設定
 os.environ["LD_LIBRARY_PATH"] = "/usr/lib:/usr/lib64:" + os.environ.get("LD_LIBRARY_PATH", "")
 
+#############################
+# (0) GPU ごとの負荷ワーカー起動
+#############################
+def _device_worker(target, load_percentage, stop_event, gpu_id):
+    """子プロセス側: 担当 GPU だけを見えるようにして device 0 として負荷をかける。"""
+    os.environ["HIP_VISIBLE_DEVICES"] = str(gpu_id)
+    target(load_percentage, stop_event, 0)
+
+def _start_per_gpu(target, load_percentage, stop_event, gpu_ids):
+    """
+    target(load_percentage, stop_event, gpu_id) を GPU ごとに起動します。
+    GPU が 1 枚ならスレッド、2 枚以上なら GPU ごとに 1 プロセス (spawn) で起動し、
+    GIL とホスト側のカーネル起動を GPU 間で取り合わないようにします。
+    子プロセスへは stop_event のセットを転送し、停止後に回収します。
+    """
+    if len(gpu_ids) <= 1:
+        for gpu_id in gpu_ids:
+            threading.Thread(
+                target=target,
+                args=(load_percentage, stop_event, gpu_id),
+                daemon=True
+            ).start()
+        return
+
+    ctx = mp.get_context("spawn")
+    child_stop = ctx.Event()
+    procs = [
+        ctx.Process(
+            target=_device_worker,
+            args=(target, load_percentage, child_stop, gpu_id),
+            daemon=True
+        )
+        for gpu_id in gpu_ids
+    ]
+    for p in procs:
+        p.start()
+
+    def forward_stop():
+        stop_event.wait()
+        child_stop.set()
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                print(f"[ROCm][WARN] Worker process {p.pid} did not stop; terminating.")
+                p.terminate()
+
+    threading.Thread(target=forward_stop, daemon=True).start()
+
 #############################
 # (1) GPGPU 負荷（テンソル計算）
 #############################
-def tensor_calculation(load_percentage, stop_event, gpu_id):
+# 正方行列の辺の長さの候補（大きい順）
+GEMM_SIZES = [8192, 4096, 2048, 1024, 512]
+GEMM_SIZE_RECOVERY = 20  # この回数連続で成功したら 1 段大きいサイズに戻す
+GEMM_BATCH = 4           # 1 回の同期までにストリームへ積む行列積の数
+
+def _capture_gemm_graph(a, b, c, stream, pool):
+    """
+    GEMM_BATCH 回ぶんの行列積を CUDA(HIP) グラフにキャプチャして返します。
+    以降は replay() 1 回でカーネル起動のオーバーヘッドなしに同じ処理を再実行できます。
+    キャプチャできない環境では None を返し、呼び出し側は通常の起動に戻ります。
+    """
+    try:
+        # BLAS のハンドルやワークスペースの遅延初期化を、キャプチャに使うストリーム上で済ませておく
+        with torch.cuda.stream(stream):
+            torch.matmul(a, b, out=c)
+        stream.synchronize()
+        graph = torch.cuda.CUDAGraph()
+        # VRAM 負荷や描画のスレッドが同時に GPU を使ってもキャプチャを壊さないよう thread_local にする
+        with torch.cuda.graph(graph, pool=pool, stream=stream, capture_error_mode="thread_local"):
+            for _ in range(GEMM_BATCH):
+                torch.matmul(a, b, out=c)
+        return graph
+    except RuntimeError as e:
+        print(f"[ROCm][WARN] Graph capture failed; launching GEMMs directly: {e}")
+        return None
+
+def tensor_calculation(load_percentage, stop_event, gpu_id, dtype=None):
     torch.cuda.set_device(gpu_id)
-    tensor_size = 8000  # 初期テンソルサイズ（正方行列の辺の長さ）
-    min_size = 100      # 最小サイズ
+    if dtype is None:
+        dtype = select_gemm_dtype()
+    # サイズは rocBLAS/hipBLASLt の高速タイルに乗る 2 のべき乗 (128 の倍数) に限定し、
+    # エラー時は 1 段小さく、一定回数成功したら 1 段大きくする
+    size_idx = 0
+    successes = 0
+    # 行列はサイズが変わったときだけ確保し直し、それ以外は出力先も含めて使い回す
+    a = b = c = None
+    alloc_size = 0
+    # サイズごとにキャプチャしたグラフを replay し、メモリプールはキャプチャし直しても共有する
+    graph = None
+    graph_pool = torch.cuda.graph_pool_handle()
+    # 専用ストリームに GEMM_BATCH 回ぶんの行列積をまとめて積み、
+    # 末尾のイベントだけを待つことで GPU のキューを空にしない
+    stream = torch.cuda.Stream(device=gpu_id)
+    # バッチの前後にイベントを打ち、GPU 上の実行時間からデューティ比どおりの休止時間を決める
+    started = torch.cuda.Event(enable_timing=True)
+    done = torch.cuda.Event(enable_timing=True)
+    load = min(max(load_percentage, 1), 100)
+    idle_ratio = (100 - load) / load
     while not stop_event.is_set():
+        tensor_size = GEMM_SIZES[size_idx]
         try:
-            a = torch.rand((tensor_size, tensor_size), device='cuda')
-            b = torch.rand((tensor_size, tensor_size), device='cuda')
-            _ = torch.matmul(a, b)
-            torch.cuda.synchronize()
+            with torch.cuda.stream(stream):
+                if alloc_size != tensor_size:
+                    graph = a = b = c = None
+                    alloc_size = 0
+                    a = torch.empty((tensor_size, tensor_size), device='cuda', dtype=dtype).uniform_()
+                    b = torch.empty((tensor_size, tensor_size), device='cuda', dtype=dtype).uniform_()
+                    c = torch.empty((tensor_size, tensor_size), device='cuda', dtype=dtype)
+                    alloc_size = tensor_size
+                    graph = _capture_gemm_graph(a, b, c, stream, graph_pool)
+                started.record(stream)
+                if graph is not None:
+                    graph.replay()
+                else:
+                    for _ in range(GEMM_BATCH):
+                        torch.matmul(a, b, out=c)
+                done.record(stream)
+            done.synchronize()
+            busy = started.elapsed_time(done) / 1000.0  # ms -> s
         except RuntimeError as e:
-            error_message = str(e)
-            # "invalid device function" エラーはログ出力を抑制し、サイズを縮小
-            if "invalid device function" in error_message:
-                if tensor_size > min_size:
-                    tensor_size = max(tensor_size - 500, min_size)
-                time.sleep(0.5)
-                continue
-            else:
+            successes = 0
+            # "invalid device function" エラーはログ出力を抑制する
+            if "invalid device function" not in str(e):
                 print(f"[ROCm][ERROR] Tensor calculation error on GPU {gpu_id} with size {tensor_size}: {e}")
-                new_size = max(tensor_size - 500, min_size)
-                if new_size < tensor_size:
-                    tensor_size = new_size
-                    print(f"[ROCm][INFO] Reducing tensor size to {tensor_size} on GPU {gpu_id}")
-                else:
-                    time.sleep(0.5)
-                continue
-        # 正常に計算できた場合、徐々にサイズを戻す（急激な増加は避ける）
-        if tensor_size < 8000:
-            tensor_size = min(tensor_size + 100, 8000)
-        time.sleep(1 / (load_percentage + 1))
+            if size_idx < len(GEMM_SIZES) - 1:
+                size_idx += 1
+                print(f"[ROCm][INFO] Reducing tensor size to {GEMM_SIZES[size_idx]} on GPU {gpu_id}")
+            else:
+                stop_event.wait(0.5)
+            continue
+        # 正常に計算できた場合、しばらく安定してから 1 段ずつサイズを戻す（急激な増加は避ける）
+        if size_idx > 0:
+            successes += 1
+            if successes >= GEMM_SIZE_RECOVERY:
+                size_idx -= 1
+                successes = 0
+        if idle_ratio > 0:
+            # 低負荷設定では休止が長くなるため、停止要求で即座に抜けられるよう待つ
+            stop_event.wait(busy * idle_ratio)
 
 def apply_gpu_tensor_load_func(load_percentage, stop_event, gpu_ids):
     print(f"[ROCm] Starting GPU Tensor Load with {load_percentage}% on GPUs: {gpu_ids}")
-    for gpu_id in gpu_ids:
-        threading.Thread(
-            target=tensor_calculation,
-            args=(load_percentage, stop_event, gpu_id),
-            daemon=True
-        ).start()
+    _start_per_gpu(tensor_calculation, load_percentage, stop_event, gpu_ids)
 
 #############################
 # (2) 3D描画によるGPU負荷（OpenGL/pygame）
 #############################
 try:
+    import numpy as np
     import pygame
     from pygame.locals import *
     from OpenGL.GL import *
@@ -87,24 +194,39 @@ def initialize_lighting():
     glLightfv(GL_LIGHT0, GL_DIFFUSE, [1.0, 1.0, 1.0, 1.0])
     glEnable(GL_COLOR_MATERIAL)
 
+# キューブの頂点 8 個と、面ごとの頂点インデックス (GL_QUADS 6 面 = 24 個)
+CUBE_VERTICES = [
+    (-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1),
+    (-1, -1, 1),  (1, -1, 1),  (1, 1, 1),  (-1, 1, 1)
+]
+CUBE_FACES = [
+    (0, 1, 2, 3),
+    (4, 5, 6, 7),
+    (0, 1, 5, 4),
+    (2, 3, 7, 6),
+    (1, 2, 6, 5),
+    (0, 3, 7, 4)
+]
+
+def create_cube_buffers():
+    """
+    キューブの頂点とインデックスを VBO/EBO に一度だけ転送し、(vbo, ebo) を返します。
+    以降の描画は draw_cube() の glDrawElements 1 回で済みます。
+    """
+    vertices = np.array(CUBE_VERTICES, dtype=np.float32)
+    indices = np.array(CUBE_FACES, dtype=np.uint32)
+    vbo, ebo = glGenBuffers(2)
+    glBindBuffer(GL_ARRAY_BUFFER, vbo)
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ebo)
+    glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, None)
+    return vbo, ebo
+
 def draw_cube():
-    vertices = [
-        (-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1),
-        (-1, -1, 1),  (1, -1, 1),  (1, 1, 1),  (-1, 1, 1)
-    ]
-    faces = [
-        (0, 1, 2, 3),
-        (4, 5, 6, 7),
-        (0, 1, 5, 4),
-        (2, 3, 7, 6),
-        (1, 2, 6, 5),
-        (0, 3, 7, 4)
-    ]
-    glBegin(GL_QUADS)
-    for face in faces:
-        for vertex in face:
-            glVertex3fv(vertices[vertex])
-    glEnd()
+    # 頂点配列とインデックスは create_cube_buffers() でバインド済み
+    glDrawElements(GL_QUADS, len(CUBE_FACES) * 4, GL_UNSIGNED_INT, None)
 
 def render_gpu_load(load_percentage, stop_event, gpu_id):
     if pygame is None:
@@ -134,6 +256,7 @@ def render_gpu_load(load_percentage, stop_event, gpu_id):
         glEnable(GL_DEPTH_TEST)
         initialize_lighting()
         glClearColor(0.2, 0.2, 0.2, 1.0)
+        cube_buffers = create_cube_buffers()
     except Exception as e:
         print(f"[ROCm][ERROR] OpenGL initialization failed: {e}")
         pygame.quit()
@@ -156,12 +279,15 @@ def render_gpu_load(load_percentage, stop_event, gpu_id):
             print(f"[ROCm][ERROR] OpenGL drawing error: {e}")
             break
 
-        glFinish()  # GPUに描画命令を確実に送る
+        # バッファの入れ替えで描画命令が送られるため、glFinish で毎フレーム
+        # パイプラインを空にする必要はない
+        pygame.display.flip()
         clock.tick(60)
         frame_count += 1
         if frame_count % 60 == 0:
             print(f"[ROCm][INFO] GPU 3D load test on GPU {gpu_id}: {frame_count} frames rendered.")
         rotation_angle += load_percentage * 0.1
+    glDeleteBuffers(2, cube_buffers)
     pygame.quit()
     print(f"[ROCm][INFO] Exiting GPU 3D load test on GPU {gpu_id}.")
 
@@ -169,12 +295,9 @@ def render_gpu_load(load_percentage, stop_event, gpu_id):
 # (3) 複合負荷（テンソル計算＋3D描画）
 #############################
 def apply_combined_load_func(load_percentage, stop_event, gpu_ids):
+    _start_per_gpu(tensor_calculation, load_percentage, stop_event, gpu_ids)
+    # 描画は pygame のウィンドウを持つため、従来どおりこのプロセスのスレッドで行う
     for gpu_id in gpu_ids:
-        threading.Thread(
-            target=tensor_calculation,
-            args=(load_percentage, stop_event, gpu_id),
-            daemon=True
-        ).start()
         threading.Thread(
             target=render_gpu_load,
             args=(load_percentage, stop_event, gpu_id),
@@ -184,53 +307,77 @@ def apply_combined_load_func(load_percentage, stop_event, gpu_ids):
 #############################
 # (4) VRAM負荷テスト
 #############################
+VRAM_CHUNK_ALIGN = 2 * 1024 * 1024  # 追加確保のサイズをこの単位に切り上げる
+
 def allocate_vram_dynamic(vram_percentage, stop_event, gpu_id):
     device = torch.device(f'cuda:{gpu_id}')
     print(f"[ROCm] Starting VRAM load on GPU {gpu_id} => target={vram_percentage}% of total memory.")
     allocated_tensors = []
+    # 確保は torch.empty のみで初期化せず、書き込みは既定の (最低) 優先度のストリームに限る
+    touch_stream = torch.cuda.Stream(device=device, priority=0)
+
+    # 目標量までを最初にまとめて確保し、以降はその領域を書き換えて使い続ける。
+    # 超過時に解放量を目標の 1/10 程度に抑えられるよう、1 個の巨大テンソルではなく分割して持つ
+    free_mem, total_mem = torch.cuda.mem_get_info(device=device)
+    target_bytes = int(total_mem * (vram_percentage / 100.0))
+    tolerance = total_mem // 100  # 目標との差が1%以内なら再確保しない
+    remaining = min(target_bytes - (total_mem - free_mem), free_mem)
+    initial_chunk = -(-max(target_bytes // 10, 1) // VRAM_CHUNK_ALIGN) * VRAM_CHUNK_ALIGN
+    while remaining > 0 and not stop_event.is_set():
+        size = min(initial_chunk, remaining)
+        try:
+            allocated_tensors.append(torch.empty(size, dtype=torch.uint8, device=device))
+        except RuntimeError as e:
+            print(f"[ROCm][WARN] OOM on GPU {gpu_id}: {e}")
+            break
+        remaining -= size
+
     while not stop_event.is_set():
         free_mem, total_mem = torch.cuda.mem_get_info(device=device)
-        used_mem = total_mem - free_mem
-        target_bytes = int(total_mem * (vram_percentage / 100.0))
-        if used_mem < target_bytes:
+        # 解放済みでもキャッシュに残っている分は再利用できるため使用量から除く
+        cached = torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+        used_mem = total_mem - free_mem - cached
+        if abs(used_mem - target_bytes) <= tolerance:
+            # 確保済み領域を書き換えてメモリ負荷を維持する。
+            # 行列演算のストリームと競合しないよう、最低優先度の専用ストリームで行う
+            with torch.cuda.stream(touch_stream):
+                for tensor in allocated_tensors:
+                    tensor.random_()
+            touch_stream.synchronize()
+            stop_event.wait(0.2)
+        elif used_mem < target_bytes:
             to_allocate = target_bytes - used_mem
-            chunk_size = max(to_allocate // 10, 1)
-            chunk_size_float = max(chunk_size // 4, 1)
+            # バイト単位 (uint8) で確保し、アロケータの粒度 (2 MiB) に切り上げる
+            chunk_size = max(to_allocate // 10, 4096)
+            chunk_size = -(-chunk_size // VRAM_CHUNK_ALIGN) * VRAM_CHUNK_ALIGN
             try:
-                tensor = torch.zeros(chunk_size_float, dtype=torch.float32, device=device)
+                tensor = torch.empty(chunk_size, dtype=torch.uint8, device=device)
                 allocated_tensors.append(tensor)
             except RuntimeError as e:
                 error_message = str(e)
                 if "invalid device function" in error_message:
-                    time.sleep(1.0)
+                    stop_event.wait(1.0)
                     continue
                 else:
                     print(f"[ROCm][WARN] OOM on GPU {gpu_id}: {e}")
-                    time.sleep(1.0)
-            time.sleep(0.1)
+                    stop_event.wait(1.0)
+            stop_event.wait(0.1)
         elif used_mem > target_bytes:
             to_free = used_mem - target_bytes
             freed = 0
             while freed < to_free and allocated_tensors:
                 pop_tensor = allocated_tensors.pop()
-                freed += pop_tensor.numel() * 4
+                freed += pop_tensor.numel()
                 del pop_tensor
-            torch.cuda.empty_cache()
-            time.sleep(0.1)
-        else:
-            time.sleep(0.2)
+            # empty_cache() は同期を伴い負荷が途切れるため、ループ中は呼ばずキャッシュを再利用する
+            stop_event.wait(0.1)
     print(f"[ROCm][INFO] Stopping VRAM load on GPU {gpu_id}. Freed all allocated tensors.")
     del allocated_tensors
     torch.cuda.empty_cache()
     print(f"[ROCm][INFO] GPU {gpu_id} memory freed.")
 
 def apply_gpu_vram_load_func(vram_percentage, stop_event, gpu_ids):
-    for gpu_id in gpu_ids:
-        threading.Thread(
-            target=allocate_vram_dynamic,
-            args=(vram_percentage, stop_event, gpu_id),
-            daemon=True
-        ).start()
+    _start_per_gpu(allocate_vram_dynamic, vram_percentage, stop_event, gpu_ids)
 
 #########################################
 # エクスポートする関数名（main.pyから同一のAPI名で呼び出し）
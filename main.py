@@ -7,7 +7,11 @@ from tkinter import ttk, messagebox
 import threading
 import multiprocessing
 import time
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait
 import psutil
+# torch より先に設定しておく (gpu_load 側の設定は torch 読み込み後になるため)。ユーザー指定があればそちらを優先
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:512")
 import torch
 
 
@@ -22,7 +26,7 @@ from util.test_runner import (
 )
 from util.test_manager   import stop_all_tests
 from util.result_manager import show_summary_window
-from util.ui_helpers     import create_burnin_popup, create_net_popup
+from util.ui_helpers     import create_burnin_popup, create_net_popup, CappedScrolledText
 # --- 個別テストモジュール ---
 from storage_load.storage_test import StorageTestApp
 from network_test.nettest import NetworkTestApp
@@ -41,11 +45,12 @@ except ImportError:
     print("Warning: gpu_load module not found. GPU tests will be skipped.")
 
 try:
-    from system_info.system_info import get_cpu_info, get_gpu_info, get_psu_power
+    from system_info.system_info import get_cpu_info, get_gpu_info, get_psu_power, get_vram_usage
 except ImportError:
     get_cpu_info = lambda: "CPU info module not found."
     get_gpu_info = lambda: "GPU info module not found."
     get_psu_power = lambda: "PSU Power: N/A (module not found)"
+    get_vram_usage = lambda: None
     print("Warning: system_info module not found.")
 
 try:
@@ -213,7 +218,7 @@ def create_burnin_popup(root):
     popup = tk.Toplevel(root)
     popup.title("Burn‑in Test Progress")
     popup.geometry("600x400")
-    progress_area = tk.Text(popup, height=20, width=70, font=("Helvetica", 10))
+    progress_area = CappedScrolledText(popup, height=20, width=70, font=("Helvetica", 10))
     progress_area.pack(padx=10, pady=10)
     return popup, progress_area
 
@@ -221,7 +226,7 @@ def create_net_popup(root):
     popup = tk.Toplevel(root)
     popup.title("Network Test Progress")
     popup.geometry("400x300")
-    net_area = tk.Text(popup, height=15, width=50, font=("Helvetica", 10))
+    net_area = CappedScrolledText(popup, height=15, width=50, font=("Helvetica", 10))
     net_area.pack(padx=10, pady=10)
     return popup, net_area
 
@@ -237,12 +242,16 @@ class LoadTestApp:
         self.summary_window = None
         self.sound_threshold = 0.6
         self.update_loop_id = None
+        self.burnin_after_id = None
 
         self.cpu_load = tk.IntVar(value=0)
         self.gpu_load = tk.IntVar(value=0)
         self.gpu_vram_load = tk.IntVar(value=0)
         self.gpu_load_type = tk.StringVar(value="3D Render")
         self.cpu_load_type = tk.StringVar(value="Standard")
+        # CPU 負荷関数は選択が変わったときだけ解決し、run_cpu_load からは Tcl 変数を読まない
+        self._update_cpu_fn()
+        self.cpu_load_type.trace_add("write", self._update_cpu_fn)
 
         self.cpu_stop_event     = None
         self.gpu_stop_event     = None
@@ -250,6 +259,9 @@ class LoadTestApp:
         self.sound_stop_event   = None
         self.network_stop_event = None
         self.burnin_stop_event  = threading.Event()
+        self.stop_events        = []  # 停止時にセットする stop_event の一覧 (生成時に登録)
+        # GPU の ID 一覧は起動時に 1 回だけ取得し、テスト開始のたびに使い回す
+        self.cuda_device_ids    = list(range(torch.cuda.device_count()))
 
         self.burnin_duration = tk.IntVar(value=50)
         self.stress_level = tk.StringVar(value="Low")
@@ -259,11 +271,19 @@ class LoadTestApp:
         self.cpu_threads = []
         self.cpu_processes = []
         self.gpu_threads = []
+        self.gpu_futures = []  # run_gpu_load がプールへ投入した GPU/VRAM 起動タスク
         self.sound_test_thread = None
         self.storage_test_thread = None
         self.network_test_thread = None
         self.net_popup = None
         self.burnin_popup = None
+        # 短時間で終わる補助処理（join 待ち・単発テスト）用のスレッドプール
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ui-helper")
+        self._closing = False  # exit_app 後は Exit の再クリックや WM close を無視する
+        # ワーカースレッドからのテキスト出力 (widget, text)。_ui_pump が 50ms ごとにまとめて書き込む
+        # deque の append/popleft はロック不要でスレッドセーフ
+        self.ui_queue = collections.deque()
+        self._ui_pump_id = None
 
         self.test_results = {
             "CPU": "SKIP", "GPU": "SKIP", "VRAM": "SKIP",
@@ -272,6 +292,7 @@ class LoadTestApp:
 
         self._setup_ui()
         self.display_system_info()
+        self._ui_pump_id = self.root.after(50, self._ui_pump)
 
     def _setup_ui(self):
         controls_frame = tk.Frame(self.root)
@@ -320,14 +341,11 @@ class LoadTestApp:
         self.info_area = tk.Text(self.root, height=10, width=100, font=("Helvetica", 14))
         self.info_area.grid(column=0, row=1, columnspan=6, padx=10, pady=10)
         self.info_area.insert(tk.END, "System Information will appear here.\n")
-        self.psu_power_label = tk.Label(self.root, text="PSU Power: N/A", font=("Helvetica", 14))
-        self.psu_power_label.grid(column=0, row=2, columnspan=6, pady=10)
-        self.cpu_usage_label = tk.Label(self.root, text="CPU Usage: N/A", font=("Helvetica", 14))
-        self.cpu_usage_label.grid(column=0, row=3, columnspan=6, pady=10)
-        self.memory_usage_label = tk.Label(self.root, text="Memory Usage: N/A", font=("Helvetica", 14))
-        self.memory_usage_label.grid(column=0, row=4, columnspan=6, pady=10)
-        self.gpu_vram_label = tk.Label(self.root, text="VRAM Usage: N/A", font=("Helvetica", 14))
-        self.gpu_vram_label.grid(column=0, row=5, columnspan=6, pady=10)
+        self.status_var = tk.StringVar(
+            value="PSU Power: N/A\nCPU Usage: N/A\nMemory Usage: N/A\nVRAM Usage: N/A"
+        )
+        self.status_label = tk.Label(self.root, textvariable=self.status_var, font=("Helvetica", 14), justify="left")
+        self.status_label.grid(column=0, row=2, columnspan=6, pady=10)
 
 
     def set_ui_state(self, is_testing):
@@ -360,6 +378,8 @@ class LoadTestApp:
         self.storage_stop_event = threading.Event()
         self.network_stop_event = threading.Event()
         self.sound_stop_event   = threading.Event()
+        self.stop_events = [self.cpu_stop_event, self.gpu_stop_event, self.storage_stop_event,
+                            self.network_stop_event, self.sound_stop_event]
 
         # 3) パラメータ取得
         cpu_val  = self.cpu_load.get()
@@ -456,6 +476,8 @@ class LoadTestApp:
         self.storage_stop_event = threading.Event()
         self.network_stop_event = threading.Event()
         self.sound_stop_event   = threading.Event()
+        self.stop_events = [self.cpu_stop_event, self.gpu_stop_event, self.storage_stop_event,
+                            self.network_stop_event, self.sound_stop_event]
 
         # ④ 各テストを並行実行
         threading.Thread(
@@ -492,10 +514,15 @@ class LoadTestApp:
         ).start()
 
         # ⑤ duration 秒後に全テストを停止 → 完走時に _on_burnin_complete を呼び出し
-        self.root.after(
-            duration * 1000,
-            lambda: self.stop_all_tests(self._on_burnin_complete)
-        )
+        self.burnin_stop_event.clear()
+        self.burnin_after_id = self.root.after(duration * 1000, self._burn_in_finish)
+
+    def _burn_in_finish(self):
+        """
+        duration 経過時に呼ばれ、全テストを停止してサマリを表示する。
+        """
+        self.burnin_after_id = None
+        self.stop_all_tests(self._on_burnin_complete)
 
 
 
@@ -581,17 +608,26 @@ class LoadTestApp:
 
     def _join_all_threads(self, on_done_callback=None):
         # 既存の join／terminate ロジック …
+        # 期限は全スレッド共通 (直列に 5 秒ずつ待たない)
+        deadline = time.monotonic() + 5
         for th in self.cpu_threads + self.gpu_threads + [
             self.storage_test_thread,
             self.network_test_thread,
             self.sound_test_thread
         ]:
             if th and th.is_alive():
-                th.join(timeout=5)
-        for p in self.cpu_processes:
-            if p.is_alive():
-                p.terminate()
-                p.join(timeout=5)
+                th.join(timeout=max(0, deadline - time.monotonic()))
+        for fut in self.gpu_futures:
+            fut.cancel()  # まだ開始していないものは取り消す
+        wait(self.gpu_futures, timeout=max(0, deadline - time.monotonic()))
+        self.gpu_futures.clear()
+        alive = [p for p in self.cpu_processes if p.is_alive()]
+        for p in alive:
+            p.terminate()
+        deadline = time.monotonic() + 5
+        for p in alive:
+            p.join(timeout=max(0, deadline - time.monotonic()))
+        multiprocessing.active_children()  # 終了済みの子プロセスを回収
 
         # UI 再有効化
         self.root.after(0, self.set_ui_state, False)
@@ -607,21 +643,16 @@ class LoadTestApp:
         全テストの停止イベントをセットし、バックグラウンドで
         _join_all_threads() を呼び出します。
         on_done_callback があれば、全スレッド終了後に実行されます。
+        Burn‑in 実行中に呼ばれた場合は完了タイマーを取り消し、中断として扱います。
         """
-        for ev in (
-            self.cpu_stop_event,
-            self.gpu_stop_event,
-            self.storage_stop_event,
-            self.network_stop_event,
-            self.sound_stop_event,
-        ):
-            if ev:
-                ev.set()
-        threading.Thread(
-            target=self._join_all_threads,
-            args=(on_done_callback,),
-            daemon=True
-        ).start()
+        if self.burnin_after_id is not None:
+            self.root.after_cancel(self.burnin_after_id)
+            self.burnin_after_id = None
+            self.burnin_stop_event.set()
+            self.update_status("\nBurn-in aborted by user.\n")
+        for ev in self.stop_events:
+            ev.set()
+        self._pool.submit(self._join_all_threads, on_done_callback)
 
     def update_system_info(self):
         try:
@@ -629,17 +660,18 @@ class LoadTestApp:
             cpu_usage = psutil.cpu_percent()
             memory_usage = psutil.virtual_memory().percent
 
-            vram_usage = 0
-            if torch.cuda.is_available() and torch.cuda.device_count() > 0:
-                total_mem = sum(torch.cuda.get_device_properties(i).total_memory for i in range(torch.cuda.device_count()))
-                allocated_mem = sum(torch.cuda.memory_allocated(i) for i in range(torch.cuda.device_count()))
-                if total_mem > 0:
-                    vram_usage = (allocated_mem / total_mem) * 100
-
-            self.psu_power_label.config(text=psu_power)
-            self.cpu_usage_label.config(text=f"CPU Usage: {cpu_usage}%")
-            self.memory_usage_label.config(text=f"Memory Usage: {memory_usage}%")
-            self.gpu_vram_label.config(text=f"VRAM Usage: {vram_usage:.2f}%")
+            # 複数 GPU の ROCm では負荷が子プロセス側で確保されるため、自プロセスの
+            # memory_allocated では見えない。smi のデバイス全体の値を使う
+            vram_usage = get_vram_usage()
+            vram_text = "N/A" if vram_usage is None else f"{vram_usage:.2f}%"
+
+            # 1 回の set で全項目を更新し、レイアウト計算を 1 回にまとめる
+            self.status_var.set(
+                f"{psu_power}\n"
+                f"CPU Usage: {cpu_usage}%\n"
+                f"Memory Usage: {memory_usage}%\n"
+                f"VRAM Usage: {vram_text}"
+            )
         except Exception as e:
             print(f"Error updating system info: {e}")
         finally:
@@ -653,26 +685,51 @@ class LoadTestApp:
         self.update_system_info()
 
     def exit_app(self):
+        if self._closing:
+            return
         if self.burn_in_active and not messagebox.askyesno("Exit", "A burn-in test is running. Are you sure you want to exit?"):
             return
+        self._closing = True
         self.stop_all_tests()
         self.root.after(200, self._final_exit)
 
     def _final_exit(self):
+        # 終了待ちの 200ms の間もプールへ投入できるよう、shutdown はここで行う
+        self._pool.shutdown(wait=False)
         if self.update_loop_id:
             self.root.after_cancel(self.update_loop_id)
+        if self._ui_pump_id:
+            self.root.after_cancel(self._ui_pump_id)
         self.root.quit()
         self.root.destroy()
         os._exit(0)
 
+    def _update_cpu_fn(self, *_):
+        self._cpu_fn = apply_cpu_load_x86 if self.cpu_load_type.get() == "x86" else apply_cpu_load
+
     def update_status(self, message):
         """Append a message to the info_area log and auto-scroll."""
-        if self.root.winfo_exists():
-            self.root.after(0, lambda: self.info_area.insert(tk.END, message + "\n"))
-            self.root.after(0, lambda: self.info_area.see(tk.END))
+        self.ui_queue.append((self.info_area, message + "\n"))
+
+    def _ui_pump(self):
+        """ui_queue に溜まったテキストを widget ごとに 1 回の insert/see で書き込む。"""
+        batches = {}
+        try:
+            while True:
+                widget, text = self.ui_queue.popleft()
+                batches.setdefault(widget, []).append(text)
+        except IndexError:
+            pass
+        for widget, texts in batches.items():
+            try:
+                widget.insert(tk.END, "".join(texts))
+                widget.see(tk.END)
+            except tk.TclError:
+                pass  # ポップアップが既に閉じられている
+        self._ui_pump_id = self.root.after(50, self._ui_pump)
 
     def open_sound_test_window(self):
-        threading.Thread(target=self.run_sound_test_once, daemon=True).start()
+        self._pool.submit(self.run_sound_test_once)
 
     def run_sound_test_once(self):
         if play_and_record_main is None:
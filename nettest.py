@@ -1,17 +1,48 @@
 import os
+import re
 import subprocess
 import json
-import tkinter as tk
-from tkinter import ttk, messagebox
+import socket
+import select
+import struct
+import collections
 import threading
 import time
 
+# tkinter は GUI (NetworkTestApp) を使うときだけ読み込む
+tk = ttk = messagebox = None
+
+
+def _import_tk():
+    global tk, ttk, messagebox
+    if tk is None:
+        import tkinter
+        from tkinter import ttk as _ttk, messagebox as _messagebox
+        tk, ttk, messagebox = tkinter, _ttk, _messagebox
+
 MODULE_DIR      = os.path.dirname(__file__)
 CONFIG_FILENAME = os.path.join(MODULE_DIR, "nettest_config.json")
+RESULT_MAX_LINES = 10000  # 結果エリアに残す最大行数
 
 
 def detect_default_gateway():
-    """`ip route` からデフォルトゲートウェイをパースして返す。失敗時は None."""
+    """
+    /proc/net/route からデフォルトゲートウェイを読み取って返す。失敗時は None.
+    /proc が読めない環境では `ip route` にフォールバックする。
+    """
+    try:
+        with open("/proc/net/route") as f:
+            next(f)  # ヘッダ行
+            for line in f:
+                fields = line.split()
+                # 宛先 0.0.0.0 かつ RTF_GATEWAY (0x2) の経路がデフォルトゲートウェイ
+                if fields[1] == "00000000" and int(fields[3], 16) & 0x2:
+                    # アドレスはリトルエンディアンの 16 進表記
+                    gw = fields[2]
+                    return ".".join(str(int(gw[i:i + 2], 16)) for i in (6, 4, 2, 0))
+        return None
+    except (OSError, StopIteration, IndexError, ValueError):
+        pass
     try:
         out = subprocess.check_output(["ip", "route"], universal_newlines=True)
         for line in out.splitlines():
@@ -22,9 +53,18 @@ def detect_default_gateway():
     return None
 
 
+# 設定ファイルの (mtime, 内容) キャッシュ。mtime が変わったときだけ読み直す
+_CFG_CACHE = {"mtime": -1, "cfg": None}
+
+
 def ensure_config():
-    """設定ファイルが存在しない場合、デフォルト値で作成する。"""
-    if not os.path.exists(CONFIG_FILENAME):
+    """
+    設定ファイルが存在しない場合、デフォルト値で作成する。
+    内容は mtime が変わらない限りキャッシュしたものを返す。
+    """
+    try:
+        mtime = os.stat(CONFIG_FILENAME).st_mtime_ns
+    except FileNotFoundError:
         default_cfg = {
             "network_type": "Wired",
             "target_ip":    detect_default_gateway() or "8.8.8.8",
@@ -33,7 +73,11 @@ def ensure_config():
             "interval":     5
         }
         save_config(default_cfg)
-    return load_config()
+        mtime = os.stat(CONFIG_FILENAME).st_mtime_ns
+    if mtime != _CFG_CACHE["mtime"]:
+        _CFG_CACHE["cfg"] = load_config()
+        _CFG_CACHE["mtime"] = mtime
+    return _CFG_CACHE["cfg"]
 
 
 def load_config():
@@ -47,60 +91,196 @@ def load_config():
 def save_config(cfg):
     with open(CONFIG_FILENAME, "w") as f:
         json.dump(cfg, f, indent=4)
+    # 同一 mtime 内での上書きでも次回は読み直させる
+    _CFG_CACHE["mtime"] = -1
+
+
+# ping の統計行 ("N packets transmitted, M received, ... X% packet loss") と
+# RTT 行 ("... min/avg/max... = a/b/c/...") を 1 回の走査で取り出す
+_PING_STATS_RE = re.compile(
+    rb"(\d+) packets transmitted, (\d+) (?:packets )?received.*?([\d.]+)% packet loss"
+    rb"(?:.*?min/avg/max[^=]*= ([\d.]+)/([\d.]+)/([\d.]+))?",
+    re.S
+)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY   = 0
+ICMP_PAYLOAD      = b"rocmcuda-powerloader".ljust(56, b"\0")
 
+# シーケンス番号は呼び出しをまたいで単調に進める (16 bit で一周)。
+# ソケットを使い回すため、前回の遅れた応答を今回の同じ番号の応答と取り違えないようにする
+_seq_lock = threading.Lock()
+_next_seq = 0
 
-def run_ping_test(target_ip, count=4, timeout=2):
-    """ping を実行して辞書で結果を返す。"""
+
+def _alloc_seqs(count):
+    global _next_seq
+    with _seq_lock:
+        start = _next_seq
+        _next_seq = (_next_seq + count) & 0xFFFF
+    return [(start + i) & 0xFFFF for i in range(count)]
+
+
+def open_icmp_socket():
+    """
+    非特権 ICMP ソケット (SOCK_DGRAM/IPPROTO_ICMP) を開く。
+    net.ipv4.ping_group_range で許可されていない場合は None を返す。
+    """
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError:
+        return None
+
+
+def _icmp_ping(sock, targets, count, timeout, recv_buf=None):
+    """
+    全ターゲットへの count 個の Echo Request をまとめて送信し、
+    応答を 1 つのソケットでまとめて受信する。
+    非特権ソケットでは識別子をカーネルが書き換えるため、
+    応答は (送信元アドレス, シーケンス番号) で対応付ける。
+    recv_buf を渡すと受信バッファとして使い回す。
+    戻り値は {target: run_ping_test と同じ形式の辞書}。
+    """
+    if recv_buf is None:
+        recv_buf = memoryview(bytearray(1024))
+    addrs = {target: socket.gethostbyname(target) for target in targets}
+    sent_at = {}
+    rtts = {addr: [] for addr in addrs.values()}
+    for seq in _alloc_seqs(count):
+        # チェックサムと識別子はカーネルが設定する
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, 0, seq) + ICMP_PAYLOAD
+        for addr in rtts:
+            sent_at[(addr, seq)] = time.perf_counter()
+            sock.sendto(packet, (addr, 0))
+
+    deadline = time.perf_counter() + timeout
+    while sent_at:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        ready, _, _ = select.select([sock], [], [], remaining)
+        if not ready:
+            break
+        nbytes, (src, _) = sock.recvfrom_into(recv_buf)
+        if nbytes < 8:
+            continue
+        icmp_type, _, _, _, seq = struct.unpack_from("!BBHHH", recv_buf)
+        key = (src, seq)
+        if icmp_type == ICMP_ECHO_REPLY and key in sent_at:
+            rtts[src].append((time.perf_counter() - sent_at.pop(key)) * 1000.0)
+
+    results = {}
+    for target, addr in addrs.items():
+        samples = rtts[addr]
+        res = {
+            "tx":   count,
+            "rx":   len(samples),
+            "loss": (count - len(samples)) * 100.0 / count if count else 0.0,
+        }
+        if samples:
+            res["min"], res["avg"], res["max"] = min(samples), sum(samples) / len(samples), max(samples)
+        results[target] = res
+    return results
+
+
+def run_ping_test(target_ip, count=4, timeout=2, sock=None, recv_buf=None):
+    """
+    ping を実行して辞書で結果を返す。
+    target_ip にリストを渡すと全ターゲットを 1 つのソケットでまとめて計測し、
+    {target: 結果辞書} を返す。
+    ICMP ソケットが使えればプロセスを起動せずに計測し、
+    使えない環境では ping コマンドにフォールバックする。
+    sock / recv_buf を渡した場合は呼び出し側のものを使い回し、閉じない。
+    """
+    single = isinstance(target_ip, str)
+    targets = [target_ip] if single else list(target_ip)
+    own_sock = sock is None
+    if own_sock:
+        sock = open_icmp_socket()
+    if sock is None:
+        results = {t: _run_ping_command(t, count, timeout) for t in targets}
+    else:
+        try:
+            results = _icmp_ping(sock, targets, count, timeout, recv_buf)
+        except OSError as e:
+            results = {t: {"error": str(e), "output": ""} for t in targets}
+        finally:
+            if own_sock:
+                sock.close()
+    return results[target_ip] if single else results
+
+
+def _run_ping_command(target_ip, count=4, timeout=2):
+    """ping コマンドを実行して出力をパースする。"""
     try:
         cmd = ["ping", "-c", str(count), "-W", str(timeout), target_ip]
-        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
         res = {}
-        for L in out.splitlines():
-            if "packets transmitted" in L:
-                p = L.split(",")
-                res["tx"]   = int(p[0].split()[0])
-                res["rx"]   = int(p[1].split()[0])
-                res["loss"] = float(p[2].split("%")[0])
-            if "rtt min/avg/max/mdev" in L:
-                a = L.split("=")[1].split()[0].split("/")
-                res["min"], res["avg"], res["max"] = map(float, a[:3])
+        m = _PING_STATS_RE.search(out)
+        if m:
+            tx, rx, loss, rtt_min, rtt_avg, rtt_max = m.groups()
+            res["tx"], res["rx"], res["loss"] = int(tx), int(rx), float(loss)
+            if rtt_avg is not None:
+                res["min"], res["avg"], res["max"] = float(rtt_min), float(rtt_avg), float(rtt_max)
         return res
     except subprocess.CalledProcessError as e:
-        return {"error": str(e), "output": e.output}
+        return {"error": str(e), "output": e.output.decode(errors="replace")}
 
 
-def run_network_test_loop(stop_event, callback):
+def run_network_test_loop(stop_event, callback, duration=None):
     """
-    stop_event がセットされるまで以下を繰り返す：
-      1) 設定ファイルを読んで target_ip を取得
+    stop_event がセットされるまで (duration 指定時はその秒数が経過するまで) 以下を繰り返す：
+      1) 設定ファイルを読んで target_ip (文字列またはリスト) を取得
       2) target_ip がデフォルト(8.8.8.8)ならゲートウェイを再検出
-      3) ping を実行して結果を callback に渡す
+      3) 全ターゲットをまとめて ping し、ターゲットごとに結果を callback に渡す
       4) interval 秒だけ待つ
+    ICMP ソケットと受信バッファはループ全体で 1 つを使い回す。
     """
-    while not stop_event.is_set():
-        cfg = ensure_config()
-        tgt = cfg.get("target_ip", "8.8.8.8")
-        if tgt == "8.8.8.8":
-            gw = detect_default_gateway()
-            if gw:
-                tgt = gw
-        res = run_ping_test(
-            tgt,
-            count=cfg.get("ping_count", 4),
-            timeout=cfg.get("timeout", 2)
-        )
-        callback(tgt, res)
-        for _ in range(cfg.get("interval", 5)):
-            if stop_event.is_set():
+    deadline = None if duration is None else time.monotonic() + duration
+    sock = open_icmp_socket()
+    recv_buf = memoryview(bytearray(1024))
+    try:
+        while not stop_event.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
                 break
-            time.sleep(1)
+            cfg = ensure_config()
+            targets = cfg.get("target_ip", "8.8.8.8")
+            if isinstance(targets, str):
+                # "a, b" のようなカンマ区切りも複数ターゲットとして扱う
+                targets = [t.strip() for t in targets.split(",") if t.strip()]
+            if "8.8.8.8" in targets:
+                gw = detect_default_gateway()
+                if gw:
+                    targets = [gw if t == "8.8.8.8" else t for t in targets]
+            results = run_ping_test(
+                targets,
+                count=cfg.get("ping_count", 4),
+                timeout=cfg.get("timeout", 2),
+                sock=sock,
+                recv_buf=recv_buf
+            )
+            for tgt, res in results.items():
+                callback(tgt, res)
+            # interval 秒 (期限が先ならそこまで) を 1 回の待機で消化し、停止要求があれば即座に抜ける
+            wait_s = cfg.get("interval", 5)
+            if deadline is not None:
+                wait_s = max(0, min(wait_s, deadline - time.monotonic()))
+            if stop_event.wait(wait_s):
+                break
+    finally:
+        if sock is not None:
+            sock.close()
 
 
 class NetworkTestApp:
     def __init__(self, root):
+        _import_tk()
         self.root = root
         self.stop_event = threading.Event()
         self.cfg = ensure_config()
+        # ワーカースレッドからの結果はキューに積み、メインスレッドでまとめて表示する
+        self._queue = collections.deque(maxlen=1000)
+        self._drain_id = None
 
         root.title("Network Test Settings")
         root.geometry("400x500")
@@ -162,7 +342,12 @@ class NetworkTestApp:
 
     def start(self):
         self.result_area.delete("1.0", tk.END)
-        self.stop_event.clear()
+        self._queue.clear()
+        if self._drain_id is None:
+            self._drain_id = self.root.after(100, self._drain)
+        # 前回のループを確実に止め、今回の実行専用の停止イベントを用意する
+        self.stop_event.set()
+        self.stop_event = threading.Event()
         threading.Thread(
             target=run_network_test_loop,
             args=(self.stop_event, self._on_result),
@@ -170,8 +355,22 @@ class NetworkTestApp:
         ).start()
 
     def _on_result(self, target, result):
-        self.result_area.insert(tk.END, f"→ {target}: {result}\n")
-        self.result_area.see(tk.END)
+        # ワーカースレッドから呼ばれるため、ウィジェットには触れない
+        self._queue.append(f"→ {target}: {result}\n")
+
+    def _drain(self):
+        """キューに溜まった結果を 100ms ごとにまとめて結果エリアへ書き込む。"""
+        if self._queue:
+            lines = []
+            while self._queue:
+                lines.append(self._queue.popleft())
+            self.result_area.insert(tk.END, "".join(lines))
+            # 表示行数が上限を超えたら古い行から削る
+            n_lines = int(self.result_area.index("end-1c").split(".")[0])
+            if n_lines > RESULT_MAX_LINES:
+                self.result_area.delete("1.0", f"{n_lines - RESULT_MAX_LINES + 1}.0")
+            self.result_area.see(tk.END)
+        self._drain_id = self.root.after(100, self._drain)
 
     def stop(self):
         self.stop_event.set()
@@ -179,6 +378,7 @@ class NetworkTestApp:
 
 
 if __name__ == "__main__":
+    _import_tk()
     root = tk.Tk()
     app = NetworkTestApp(root)
     root.mainloop()
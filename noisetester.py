@@ -1,12 +1,15 @@
 # sound_test/noisetester.py
-import sounddevice as sd
+import threading
 import numpy as np
 
 def play_and_record_main(duration=1.0, samplerate=44100, channels=1):
     """
     1kHzサイン波を再生しつつ録音、相互相関を返します。
-    振幅を大きくし、sd.playrecで一括再生録音する方式に変更。
+    振幅を大きくし、1 本の入出力ストリームで再生と録音を同時に行う。
     """
+    # sounddevice は読み込みが重いため、実際に再生するときだけ import する
+    import sounddevice as sd
+
     # --- テストトーン生成 (1kHz, 振幅0.8) ---
     N = int(samplerate * duration)
     t = np.linspace(0, duration, N, endpoint=False)
@@ -15,26 +18,44 @@ def play_and_record_main(duration=1.0, samplerate=44100, channels=1):
     tone = (0.8 * np.sin(2 * np.pi * freq * t)).astype('float32')
 
     # --- 再生 + 録音を一発で ---
+    # 大きめのブロックでコールバックを回し、PortAudio からの起床回数を減らす。
+    # 録音先は先に確保しておき、コールバックではスライスへコピーするだけにする
+    blocksize = 4096
+    recording = np.zeros((N, channels), dtype='float32')
+    tone_2d = np.ascontiguousarray(np.repeat(tone[:, None], channels, axis=1))
+    done = threading.Event()
+    position = 0
+
+    def callback(indata, outdata, frames, time_info, status):
+        nonlocal position
+        end = min(position + frames, N)
+        n = end - position
+        outdata[:n] = tone_2d[position:end]
+        outdata[n:] = 0
+        recording[position:end] = indata[:n]
+        position = end
+        if position >= N:
+            raise sd.CallbackStop
+
     try:
-        # playrec: 再生しながら同サイズの録音バッファを返す
-        recording = sd.playrec(
-            tone,
-            samplerate=samplerate,
-            channels=channels,
-            dtype='float32'
-        )
-        sd.wait()  # 完了までブロック
-        # playrecは (frames, channels) の形で返るので1次元化
-        recording = recording.flatten()
+        with sd.Stream(samplerate=samplerate, channels=channels, dtype='float32',
+                       blocksize=blocksize, latency='high',
+                       callback=callback, finished_callback=done.set):
+            # 完了までブロック (デバイスが止まった場合に備えて上限を設ける)
+            done.wait(duration + 2.0)
+        # (frames, channels) の形なので1次元化
+        recording = recording.ravel()
     except Exception as e:
         print(f"[ERROR] Could not play/record: {e}")
         # 録音失敗時は相関 0.0 でスキップ
         return 0.0
 
     # --- 相互相関を計算し、正規化して返す ---
-    # tone と recording の長さが同じなので 'full' で計算
-    corr = np.correlate(recording, tone, mode='full')
-    # 真ん中で最大値
+    # 'full' 相当の相互相関を FFT で O(N log N) で計算する
+    # (ゼロ詰め長を N+M-1 以上にすれば巡回相関の値は全ラグで一致する)
+    n_fft = 1 << (len(recording) + len(tone) - 2).bit_length()
+    spec = np.fft.rfft(recording, n_fft) * np.conj(np.fft.rfft(tone, n_fft))
+    corr = np.fft.irfft(spec, n_fft)
     if corr.size > 0:
         norm = np.sqrt(np.dot(recording, recording) * np.dot(tone, tone))
         return float(np.max(corr) / norm) if norm != 0 else 0.0
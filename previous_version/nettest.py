@@ -1,6 +1,9 @@
 import os
 import subprocess
 import json
+import socket
+import select
+import struct
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
@@ -49,8 +52,82 @@ def save_config(cfg):
         json.dump(cfg, f, indent=4)
 
 
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY   = 0
+ICMP_PAYLOAD      = b"rocmcuda-powerloader".ljust(56, b"\0")
+
+# シーケンス番号は呼び出しをまたいで単調に進める (16 bit で一周)
+_seq_lock = threading.Lock()
+_next_seq = 0
+
+
+def _alloc_seqs(count):
+    global _next_seq
+    with _seq_lock:
+        start = _next_seq
+        _next_seq = (_next_seq + count) & 0xFFFF
+    return [(start + i) & 0xFFFF for i in range(count)]
+
+
+def _icmp_ping(sock, target_ip, count, timeout):
+    """
+    非特権 ICMP ソケットで count 個の Echo Request をまとめて送り、
+    応答をシーケンス番号で対応付けて RTT を計測する。
+    """
+    addr = socket.gethostbyname(target_ip)
+    sent_at = {}
+    for seq in _alloc_seqs(count):
+        # チェックサムと識別子はカーネルが設定する
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, 0, seq) + ICMP_PAYLOAD
+        sent_at[seq] = time.perf_counter()
+        sock.sendto(packet, (addr, 0))
+
+    samples = []
+    deadline = time.perf_counter() + timeout
+    while sent_at:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        ready, _, _ = select.select([sock], [], [], remaining)
+        if not ready:
+            break
+        data, (src, _) = sock.recvfrom(1024)
+        if len(data) < 8 or src != addr:
+            continue
+        icmp_type, _, _, _, seq = struct.unpack_from("!BBHHH", data)
+        if icmp_type == ICMP_ECHO_REPLY and seq in sent_at:
+            samples.append((time.perf_counter() - sent_at.pop(seq)) * 1000.0)
+
+    res = {
+        "tx":   count,
+        "rx":   len(samples),
+        "loss": (count - len(samples)) * 100.0 / count if count else 0.0,
+    }
+    if samples:
+        res["min"], res["avg"], res["max"] = min(samples), sum(samples) / len(samples), max(samples)
+    return res
+
+
 def run_ping_test(target_ip, count=4, timeout=2):
-    """ping を実行して辞書で結果を返す。"""
+    """
+    ping を実行して辞書で結果を返す。
+    非特権 ICMP ソケットが使えればプロセスを起動せずに計測し、
+    使えない環境 (net.ipv4.ping_group_range) では ping コマンドにフォールバックする。
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError:
+        return _run_ping_command(target_ip, count, timeout)
+    try:
+        return _icmp_ping(sock, target_ip, count, timeout)
+    except OSError as e:
+        return {"error": str(e), "output": ""}
+    finally:
+        sock.close()
+
+
+def _run_ping_command(target_ip, count=4, timeout=2):
+    """ping コマンドを実行して出力をパースする。"""
     try:
         cmd = ["ping", "-c", str(count), "-W", str(timeout), target_ip]
         out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
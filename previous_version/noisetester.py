@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 import os, sys
-import sounddevice as sd
+import math
+import time
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import warnings
 from datetime import datetime
-from scipy.signal import butter, sosfiltfilt, correlate
+# sounddevice / matplotlib / scipy は読み込みが重いため、使う関数の中で import する
 warnings.filterwarnings("ignore", category=UserWarning, module='matplotlib.font_manager')
 
 # -----------------------------
@@ -23,18 +21,103 @@ DEFAULT_AMPLITUDE = 1.0
 SOUND_TRIALS = 5       # 複数試行の回数
 FILTER_LOW = 300       # 帯域フィルタ下限 (Hz)
 FILTER_HIGH = 3000     # 帯域フィルタ上限 (Hz)
+PLOT_POINTS = 2000     # 波形プロット時の間引き後の点数
+
+# -----------------------------
+# 遅延 import
+# -----------------------------
+def _lazy_plt():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+# -----------------------------
+# プロット用の間引き
+# -----------------------------
+_TIME_AXIS_CACHE = {}
+
+def _plot_index(n_samples):
+    """
+    n_samples 点の波形を PLOT_POINTS 点に間引くためのインデックスと、
+    対応する時間軸 (秒, float32) を返す。
+    録音側と描画側、複数回の試行で同じ配列を共有するためキャッシュする (読み取り専用)。
+    """
+    key = (n_samples, RATE)
+    cached = _TIME_AXIS_CACHE.get(key)
+    if cached is None:
+        idx = np.linspace(0, n_samples - 1, min(PLOT_POINTS, n_samples)).astype(np.int64)
+        time_axis = idx.astype(np.float32) * np.float32(1.0 / RATE)
+        idx.flags.writeable = False
+        time_axis.flags.writeable = False
+        cached = _TIME_AXIS_CACHE[key] = (idx, time_axis)
+    return cached
 
 # -----------------------------
 # Sine wave generator
 # -----------------------------
-def generate_sine_wave(frequency, duration, rate, amplitude=1.0):
-    t = np.linspace(0, duration, int(rate * duration), endpoint=False)
-    return amplitude * np.sin(2 * np.pi * frequency * t)
+def generate_sine_wave(frequency, duration, rate, amplitude=1.0, dtype=None):
+    n_samples = int(rate * duration)
+    w = np.float32(2 * np.pi * frequency / rate)  # 1 サンプルあたりの位相増分
+    if float(frequency).is_integer() and float(rate).is_integer():
+        # 整数周波数では波形が rate/gcd サンプルごとに厳密に繰り返すので、
+        # 1 周期分だけ sin を計算して敷き詰める (1kHz/44.1kHz なら 441 サンプル)
+        period = int(rate) // math.gcd(int(frequency), int(rate))
+        n = np.arange(min(period, n_samples), dtype=np.float32)
+        wave = np.resize(np.float32(amplitude) * np.sin(w * n), n_samples)
+    else:
+        wave = np.float32(amplitude) * _rotating_sine(2 * np.pi * frequency / rate, n_samples)
+    if dtype is None:
+        return wave
+    if np.issubdtype(dtype, np.integer):
+        # 整数 PCM はフルスケールに合わせて量子化する
+        return (wave * np.iinfo(dtype).max).astype(dtype)
+    return wave.astype(dtype)
+
+def _rotating_sine(w, n_samples):
+    """
+    sin(w*n) (n = 0..n_samples-1) を回転子の積で生成する (float32)。
+    ブロック内の位相 exp(i*w*j) とブロック先頭の位相 exp(i*w*B*k) の外積を取るので、
+    超越関数の評価は約 2*sqrt(n_samples) 回で済み、残りは複素乗算のみになる。
+    """
+    if n_samples <= 0:
+        return np.zeros(0, dtype=np.float32)
+    block = math.isqrt(n_samples) + 1
+    n_blocks = -(-n_samples // block)
+    head = np.exp(1j * w * np.arange(block)).astype(np.complex64)
+    steps = np.exp(1j * w * block * np.arange(n_blocks)).astype(np.complex64)
+    return np.outer(steps, head).imag.ravel()[:n_samples]
+
+def to_pcm16(wave):
+    """[-1, 1] の浮動小数点波形を int16 PCM に量子化する。"""
+    return (wave * np.iinfo(np.int16).max).astype(np.int16)
+
+_SINE_CACHE = {}
+
+def _sine_template(duration, pcm16=False, unit=False):
+    """
+    テスト用サイン波 (FREQUENCY, DEFAULT_AMPLITUDE) を duration ごとに一度だけ生成して使い回す。
+    pcm16=True なら再生用の int16 版、unit=True なら相関計算用に
+    平均 0・ノルム 1 に正規化した版を返す。共有するため読み取り専用にしてある。
+    """
+    key = (duration, pcm16, unit)
+    wave = _SINE_CACHE.get(key)
+    if wave is None:
+        if pcm16:
+            wave = to_pcm16(_sine_template(duration))
+        elif unit:
+            wave = _unit_rows(_sine_template(duration))
+        else:
+            wave = generate_sine_wave(FREQUENCY, duration, RATE, amplitude=DEFAULT_AMPLITUDE)
+        wave.flags.writeable = False
+        _SINE_CACHE[key] = wave
+    return wave
 
 # -----------------------------
 # SOS bandpass filter (zero-phase)
 # -----------------------------
 def sos_bandpass_filter(data, sr, lowcut, highcut, order=4):
+    from scipy.signal import butter, sosfiltfilt
     sos = butter(order, [lowcut, highcut], btype='band', fs=sr, output='sos')
     return sosfiltfilt(sos, data)
 
@@ -42,72 +125,192 @@ def sos_bandpass_filter(data, sr, lowcut, highcut, order=4):
 # 安定版ラッパー関数：複数試行＋中央値評価
 # -----------------------------
 def stable_play_and_record(n_trials=SOUND_TRIALS):
-    cors = []
-    template = generate_sine_wave(FREQUENCY, DURATION_MAIN, RATE, amplitude=DEFAULT_AMPLITUDE)
+    """
+    本テストを n_trials 回行い、平均相関の中央値で評価する。
+    各試行ではプロットせず、中央値に当たる試行の結果だけを最後に保存する。
+    """
+    cors, details = [], []
     for i in range(n_trials):
-        sig = play_and_record_main()
-        if sig is None:
+        result = _run_main_test()
+        if result is None:
             cors.append(0.0)
             continue
-        rec = sos_bandpass_filter(sig.flatten(), RATE, FILTER_LOW, FILTER_HIGH)
-        corr = correlate(rec, template, mode='valid')
-        cors.append(np.max(corr) / (np.linalg.norm(rec) * np.linalg.norm(template)))
+        mean_corr, plot_args = result
+        cors.append(mean_corr)
+        details.append((mean_corr, plot_args))
     median_corr = float(np.median(cors))
     print(f"[stable] Trials={n_trials}, raw cors={cors}, median={median_corr:.4f}")
+    if details:
+        _, plot_args = min(details, key=lambda d: abs(d[0] - median_corr))
+        _save_plots(*plot_args)
     return median_corr
 
 # -----------------------------
 # 一回再生／録音関数
 # -----------------------------
-def _play_and_record_once(duration, device_index, amplitude=DEFAULT_AMPLITUDE):
-    sine_wave = generate_sine_wave(FREQUENCY, duration, RATE, amplitude)
-    recorded_data = np.zeros((int(RATE * duration), CHANNELS), dtype=np.float32)
+def _play_and_record_once(duration, device_index, amplitude=DEFAULT_AMPLITUDE,
+                          sine_wave=None, recorded_data=None):
+    """
+    sine_wave (int16 の再生波形) と recorded_data (int16 の録音バッファ) を
+    渡すと再生成・再確保せずに使い回す。
+    """
+    import sounddevice as sd
+    # ストリームはデバイスのネイティブ形式に近い int16 で扱い、転送量と変換を減らす
+    if sine_wave is None:
+        sine_wave = generate_sine_wave(FREQUENCY, duration, RATE, amplitude, dtype=np.int16)
+    tone = sine_wave.reshape(-1, CHANNELS)
+    if recorded_data is None:
+        recorded_data = np.zeros((len(tone), CHANNELS), dtype=np.int16)
+    else:
+        # 途中で止まった録音が前のデバイスの音で採点されないよう、使い回す前に消しておく
+        recorded_data.fill(0)
+    # 再生と録音は sd.playrec に任せ、録音は渡されたバッファへ直接書き込ませる
+    try:
+        sd.playrec(tone, samplerate=RATE, channels=CHANNELS, dtype='int16',
+                   out=recorded_data, device=(device_index, device_index),
+                   blocking=False)
+        # デバイスが止まった場合に備えて待ち時間に上限を設ける
+        deadline = time.monotonic() + duration + 2.0
+        while sd.get_stream().active:
+            if time.monotonic() >= deadline:
+                sd.stop()
+                print(f"[ERROR] Playback/recording timed out on device {device_index}")
+                return None
+            sd.sleep(50)
+    except Exception as e:
+        print(f"[ERROR] Could not open stream on device {device_index}: {e}")
+        return None
+
+    # 相関計算・プロット側は従来どおり [-1, 1] の float32 を受け取る
+    return recorded_data.astype(np.float32) * np.float32(1.0 / 32768)
+
+# -----------------------------
+# 本テスト用の再生／録音 (セグメント単位で逐次相関)
+# -----------------------------
+def _unit_rows(ref_segs):
+    """各行を平均 0・ノルム 1 に正規化した参照波形 (float32) を返す。"""
+    ref = ref_segs - ref_segs.mean(axis=-1, keepdims=True)
+    norm = np.linalg.norm(ref, axis=-1, keepdims=True)
+    ref /= np.where(norm == 0, 1, norm)
+    return ref
+
+def _segment_correlations(ref_unit, rec_segs):
+    """
+    _unit_rows で正規化済みの参照波形 (セグメント数, セグメント長) と録音から、
+    セグメントごとのピアソン相関の絶対値をまとめて求める。無音のセグメントは 0。
+    """
+    # 参照側は正規化済みなので、録音側の平均を引いた内積を録音側のノルムで割るだけでよい
+    rec_c = rec_segs - rec_segs.mean(axis=1, keepdims=True)
+    num = np.einsum('ij,ij->i', ref_unit, rec_c)
+    norm = np.sqrt(np.einsum('ij,ij->i', rec_c, rec_c))
+    silent = ~np.any(rec_segs, axis=1) | (norm == 0)
+    return np.where(silent, 0.0, np.abs(num) / np.where(silent, 1.0, norm))
+
+def _play_and_record_segments(duration, device_index, sine_wave, start_time, segment_duration,
+                              tone=None):
+    """
+    sine_wave (float32) を再生しながら録音し、start_time 秒から
+    segment_duration 秒ごとのセグメント相関をその場で計算する。
+    録音全体は保持せず、2 セグメント分のリングバッファと
+    プロット用に間引いたサンプル (PLOT_POINTS 点) だけを持つ。
+    tone に int16 の再生波形を渡すと変換を省略する。
+    戻り値は (セグメント開始時刻のリスト, 相関の配列, プロット用録音)。失敗時は None。
+    """
+    import queue
+    import sounddevice as sd
+    if tone is None:
+        tone = to_pcm16(sine_wave)
+    tone = np.ascontiguousarray(tone.reshape(-1, CHANNELS))
+    n_tone = len(tone)
+    n_rec = int(RATE * duration)
+    seg_len = int(RATE * segment_duration)
+    st = int(RATE * start_time)
+    n_segs = max(0, (n_rec - segment_duration * RATE - st) // seg_len + 1)
+    ed = st + n_segs * seg_len
+    segment_times = [start_time + k * segment_duration for k in range(n_segs)]
+    # 参照波形のセグメントは録音前に一度だけ正規化しておく
+    ref_unit = _unit_rows(sine_wave[st:ed].reshape(n_segs, seg_len))
+
+    ring = np.zeros((2, seg_len), dtype=np.int16)
+    ready = queue.SimpleQueue()
+    plot_idx, _ = _plot_index(n_rec)
+    plot_rec = np.zeros(len(plot_idx), dtype=np.int16)
+    position = [0]
 
+    # オーディオスレッドではスライス代入と完了通知のみを行い、相関計算は呼び出し側で行う
     def callback(in_data, out_data, frames, time_info, status):
-        start = callback.frame
-        if start >= len(sine_wave):
-            out_data[:] = 0
-        else:
-            n = min(len(sine_wave) - start, frames)
-            out_data[:n] = sine_wave[start:start+n].reshape(-1, CHANNELS)
-            if n < frames:
-                out_data[n:] = 0
-        n = min(len(recorded_data) - start, frames)
-        if n > 0:
-            chunk = np.frombuffer(in_data, dtype=np.float32).reshape(-1, CHANNELS)
-            recorded_data[start:start+n] = chunk[:n]
-        callback.frame += frames
-
-    callback.frame = 0
+        start = position[0]
+        end = start + frames
+        n = max(0, min(n_tone - start, frames))
+        out_data[:n] = tone[start:start+n]
+        out_data[n:] = 0
+        lo, hi = np.searchsorted(plot_idx, (start, end))
+        plot_rec[lo:hi] = in_data[plot_idx[lo:hi] - start, 0]
+        pos = max(start, st)
+        while pos < min(end, ed):
+            k, off = divmod(pos - st, seg_len)
+            n = min(seg_len - off, min(end, ed) - pos)
+            ring[k % 2, off:off+n] = in_data[pos-start:pos-start+n, 0]
+            pos += n
+            if off + n == seg_len:
+                ready.put(k)
+        position[0] = end
+
+    correlations = np.zeros(n_segs, dtype=np.float32)
     try:
-        with sd.Stream(samplerate=RATE, channels=CHANNELS, dtype='float32',
+        with sd.Stream(samplerate=RATE, channels=CHANNELS, dtype='int16',
                        device=(device_index, device_index),
                        blocksize=1024, latency='low',
                        callback=callback):
-            sd.sleep(int((duration + 0.5) * 1000))
+            t_end = time.monotonic() + duration + 0.5
+            scored = 0
+            while scored < n_segs:
+                try:
+                    ks = [ready.get(timeout=max(0.0, t_end - time.monotonic()) + segment_duration)]
+                except queue.Empty:
+                    print("[WARN] recording stalled; remaining segments scored as 0.")
+                    break
+                # 溜まっている完了セグメントもまとめて 1 回で計算する
+                while True:
+                    try:
+                        ks.append(ready.get_nowait())
+                    except queue.Empty:
+                        break
+                rec_segs = ring[[k % 2 for k in ks]].astype(np.float32)
+                correlations[ks] = _segment_correlations(ref_unit[ks], rec_segs)
+                scored += len(ks)
+            sd.sleep(int(max(0.0, t_end - time.monotonic()) * 1000))
     except Exception as e:
         print(f"[ERROR] Could not open stream on device {device_index}: {e}")
         return None
 
-    return recorded_data
+    return segment_times, correlations, plot_rec.astype(np.float32) * np.float32(1.0 / 32768)
 
 # -----------------------------
 # グローバル相関計算（Pre-test用）
 # -----------------------------
-def compute_correlation_global(sine_wave, recorded_data):
-    if recorded_data is None or np.max(np.abs(recorded_data)) < 1e-8:
+def compute_correlation_global(sine_wave, recorded_data, normalized=False):
+    """
+    参照波形と録音のピアソン相関の絶対値を返す。
+    normalized=True なら sine_wave は _unit_rows で正規化済みとして扱い、正規化を省く。
+    """
+    if recorded_data is None:
+        return 0.0
+    rd = recorded_data.ravel()
+    if np.abs(rd).max() < 1e-8:
         return 0.0
-    sw = sine_wave / np.max(np.abs(sine_wave))
-    rd = recorded_data.flatten()
-    rd = rd * (np.max(np.abs(sine_wave)) / (np.max(np.abs(rd)) + 1e-8))
-    rd = rd / np.max(np.abs(rd))
-    corr = np.corrcoef(sw, rd)[0,1]
-    return abs(corr)
+    sw_n = sine_wave if normalized else _unit_rows(sine_wave)
+    rd_c = rd - rd.mean()
+    rd_norm = np.linalg.norm(rd_c)
+    if rd_norm == 0:
+        return 0.0
+    return abs(float(np.dot(sw_n, rd_c))) / float(rd_norm)
 
 # -----------------------------
 # デバイス選定（Pre-test）
 # -----------------------------
 def select_device_with_pretest():
+    import sounddevice as sd
     devices = sd.query_devices()
     print("Available sound devices:")
     for idx, dev in enumerate(devices):
@@ -118,14 +321,18 @@ def select_device_with_pretest():
         print("[WARN] No full-duplex device found.")
         return None
 
-    sine = generate_sine_wave(FREQUENCY, DURATION_PRETEST, RATE, amplitude=DEFAULT_AMPLITUDE)
+    # 再生波形と録音バッファは全候補デバイスで共有する
+    sine_unit = _sine_template(DURATION_PRETEST, unit=True)
+    tone = _sine_template(DURATION_PRETEST, pcm16=True)
+    rec_buf = np.zeros((len(tone), CHANNELS), dtype=np.int16)
     best, best_corr = None, 0.0
     for idx in candidates:
-        rec = _play_and_record_once(DURATION_PRETEST, idx)
-        corr = compute_correlation_global(sine, rec)
+        rec = _play_and_record_once(DURATION_PRETEST, idx, sine_wave=tone, recorded_data=rec_buf)
+        corr = compute_correlation_global(sine_unit, rec, normalized=True)
         print(f"Pre-test device {idx}: corr={corr:.4f}")
         if corr>=PRETEST_THRESHOLD and corr>best_corr:
             best_corr, best = corr, idx
+    del rec_buf
 
     if best is None:
         print("[WARN] No device passed pre-test; using default.")
@@ -136,102 +343,102 @@ def select_device_with_pretest():
 # -----------------------------
 # 元の main テスト関数
 # -----------------------------
-def play_and_record_main():
+def _run_main_test():
+    """
+    本テストを 1 回行い、(平均相関, _save_plots に渡す引数) を返す。失敗時は None。
+    """
+    import sounddevice as sd
     # デバイス選定
     selected = select_device_with_pretest()
     sd.default.device = (selected, selected) if selected is not None else None
     print("Running main test...")
 
-    # 波形生成＆録音
-    sine_wave = generate_sine_wave(FREQUENCY, DURATION_MAIN, RATE, amplitude=DEFAULT_AMPLITUDE)
-    rec_data = _play_and_record_once(
+    # 波形生成＆録音 (セグメント相関は録音しながら計算する)
+    segment_duration = 2
+    start_time = 3
+    sine_wave = _sine_template(DURATION_MAIN)
+    result = _play_and_record_segments(
         DURATION_MAIN,
-        selected if selected is not None else sd.default.device[0]
+        selected if selected is not None else sd.default.device[0],
+        sine_wave, start_time, segment_duration,
+        tone=_sine_template(DURATION_MAIN, pcm16=True)
     )
-    if rec_data is None:
+    if result is None:
         print("[ERROR] no recorded data.")
         return None
-
-    # セグメントごとの相関計算
-    segment_duration = 2
-    start_time = 3
-    end_time = DURATION_MAIN - segment_duration
-    segment_times = []
-    correlations = []
-    while start_time <= end_time:
-        st = int(RATE * start_time)
-        ed = int(RATE * (start_time + segment_duration))
-        sw_segment = sine_wave[st:ed]
-        rd_segment = rec_data.flatten()[st:ed]
-
-        if np.max(np.abs(rd_segment)) < 1e-8:
-            correlations.append(0.0)
-            segment_times.append(start_time)
-            start_time += segment_duration
-            continue
-
-        # 正規化＆相関計算
-        sw_norm = sw_segment / np.max(np.abs(sw_segment))
-        rd_scaled = rd_segment * (np.max(np.abs(sw_segment)) / (np.max(np.abs(rd_segment)) + 1e-8))
-        rd_norm = rd_scaled / np.max(np.abs(rd_scaled))
-        rd_inv  = -rd_norm
-
-        corr_fwd = np.corrcoef(sw_norm, rd_norm)[0,1]
-        corr_inv = np.corrcoef(sw_norm, rd_inv)[0,1]
-        final_corr = corr_fwd if abs(corr_fwd) > abs(corr_inv) else corr_inv
-
-        correlations.append(abs(final_corr))
-        segment_times.append(start_time)
-        print(f"Segment {start_time}-{start_time+segment_duration}s: corr={abs(final_corr):.4f}")
-        start_time += segment_duration
+    segment_times, correlations, rec_plot = result
+    print(f"Segment corr ({segment_duration}s each from {start_time}s): "
+          f"{np.array2string(correlations, precision=4)}")
 
     # 平均相関を計算
     mean_corr = np.mean(correlations)
     print(f"Mean corr={mean_corr:.4f}")
     print("Success" if mean_corr > 0.5 else "Fail")
 
-    # --- プロット／保存 ---
+    return mean_corr, (sine_wave, segment_times, correlations, rec_plot, segment_duration)
+
+def play_and_record_main(plot=True):
+    result = _run_main_test()
+    if result is None:
+        return None
+    mean_corr, plot_args = result
+    if plot:
+        _save_plots(*plot_args)
+    return mean_corr
+
+# -----------------------------
+# プロット／保存
+# -----------------------------
+_FIGURES = None
+
+def _get_figures():
+    """波形図と相関図の Figure を初回だけ作り、以降の保存で使い回す。"""
+    global _FIGURES
+    if _FIGURES is None:
+        plt = _lazy_plt()
+        wave_fig, (wave_ax, rec_ax) = plt.subplots(2, 1, figsize=(12,6))
+        corr_fig, corr_ax = plt.subplots(figsize=(10,5))
+        _FIGURES = (wave_fig, wave_ax, rec_ax, corr_fig, corr_ax)
+    return _FIGURES
+
+def _save_plots(sine_wave, segment_times, correlations, rec_plot, segment_duration):
+    wave_fig, wave_ax, rec_ax, corr_fig, corr_ax = _get_figures()
     current_date = datetime.now().strftime("%Y%m%d")
 
     # 1) オリジナルと録音波形
-    plt.figure(figsize=(12,6))
-    plt.subplot(2,1,1)
-    time_axis = np.linspace(0, DURATION_MAIN, len(sine_wave))
-    plt.plot(time_axis, sine_wave, label='Original Sine Wave')
-    plt.title('Original Sine Wave')
-    plt.xlabel('Time (s)')
-    plt.ylabel('Amplitude')
-    plt.grid(True)
-    plt.legend()
-
-    plt.subplot(2,1,2)
-    time_axis = np.linspace(0, DURATION_MAIN, len(rec_data))
-    plt.plot(time_axis, rec_data.flatten(), label='Recorded Signal')
+    # 描画は PLOT_POINTS 点に間引いて行い、時間軸も float32 で作る
+    idx, time_axis = _plot_index(len(sine_wave))
+    wave_ax.clear()
+    wave_ax.plot(time_axis, sine_wave[idx], label='Original Sine Wave')
+    wave_ax.set_title('Original Sine Wave')
+    wave_ax.set_xlabel('Time (s)')
+    wave_ax.set_ylabel('Amplitude')
+    wave_ax.grid(True)
+    wave_ax.legend()
+
+    rec_ax.clear()
+    rec_ax.plot(time_axis, rec_plot, label='Recorded Signal')
     for st in segment_times:
-        plt.axvline(x=st, color='red', linestyle='--', alpha=0.7)
-        plt.axvline(x=st + segment_duration, color='red', linestyle='--', alpha=0.7)
-    plt.title('Recorded Signal with Segment Boundaries')
-    plt.xlabel('Time (s)')
-    plt.ylabel('Amplitude')
-    plt.grid(True)
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(f"{current_date}_original_recorded_signals.png")
-    plt.close()
+        rec_ax.axvline(x=st, color='red', linestyle='--', alpha=0.7)
+        rec_ax.axvline(x=st + segment_duration, color='red', linestyle='--', alpha=0.7)
+    rec_ax.set_title('Recorded Signal with Segment Boundaries')
+    rec_ax.set_xlabel('Time (s)')
+    rec_ax.set_ylabel('Amplitude')
+    rec_ax.grid(True)
+    rec_ax.legend()
+    wave_fig.tight_layout()
+    wave_fig.savefig(f"{current_date}_original_recorded_signals.png")
 
     # 2) セグメント相関プロット
-    plt.figure(figsize=(10,5))
-    plt.plot(segment_times, correlations, marker='o', linestyle='-')
-    plt.title('Correlation Coefficient for Each Segment')
-    plt.xlabel('Start Time of Segment (s)')
-    plt.ylabel('Absolute Correlation Coefficient')
-    plt.ylim(0, 1)
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(f"{current_date}_correlation_coefficients.png")
-    plt.close()
-
-    return mean_corr
+    corr_ax.clear()
+    corr_ax.plot(segment_times, correlations, marker='o', linestyle='-')
+    corr_ax.set_title('Correlation Coefficient for Each Segment')
+    corr_ax.set_xlabel('Start Time of Segment (s)')
+    corr_ax.set_ylabel('Absolute Correlation Coefficient')
+    corr_ax.set_ylim(0, 1)
+    corr_ax.grid(True)
+    corr_fig.tight_layout()
+    corr_fig.savefig(f"{current_date}_correlation_coefficients.png")
 
 
 # -----------------------------
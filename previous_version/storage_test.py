@@ -4,11 +4,97 @@ import time
 import subprocess
 import threading
 import hashlib
-from concurrent.futures import ThreadPoolExecutor
+import filecmp
+import shutil
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
 import json
 import re
 import tkinter as tk
 from tkinter import ttk, messagebox
+try:
+    import usb.core as _usb_core  # 任意依存 (pyusb): 無ければ sysfs で生存確認する
+except ImportError:
+    _usb_core = None
+
+PROGRESS_INTERVAL = 0.5  # 進捗コールバックの最短間隔 (秒)
+ERROR_BACKOFF = 1.0      # ストレージテスト失敗後に次の試行まで待つ時間 (秒)
+
+# lsusb -v 出力の解析用 (呼び出しごとのパターンキャッシュ参照を避けてモジュールで一度だけコンパイル)
+_LSUSB_BUS_RE = re.compile(r"(?m)^(?=Bus )")
+_USB_ID_RE = re.compile(r"ID ([0-9a-fA-F]{4}:[0-9a-fA-F]{4})")
+_BCDUSB_RE = re.compile(r"bcdUSB\s+([\d.]+)")
+
+SYSFS_USB_DIR = "/sys/bus/usb/devices"
+RESPONSE_INTERVAL = 0.05  # 応答テストの問い合わせ間隔 (秒)
+# コピー元は tmpfs (/dev/shm) に置き、ディスク読み込みが USB への書き込みと競合しないようにする
+TEST_FILE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp"
+
+HASH_BUF_SIZE = 1 << 20
+_hash_local = threading.local()
+
+def _read_sysfs(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def find_sysfs_usb_device(busnum, devnum):
+    """
+    Return the sysfs directory of the USB device at (busnum, devnum), or None.
+    """
+    try:
+        entries = list(os.scandir(SYSFS_USB_DIR))
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            if (int(_read_sysfs(os.path.join(entry.path, "busnum"))) == busnum and
+                    int(_read_sysfs(os.path.join(entry.path, "devnum"))) == devnum):
+                return entry.path
+        except (OSError, ValueError):
+            continue
+    return None
+
+def make_usb_probe(device_info):
+    """
+    Build a zero-argument probe for the device described by an lsusb line
+    ("Bus 001 Device 002: ID 0930:6544 ...").
+    The probe raises on failure. Uses a GET_DESCRIPTOR control transfer via pyusb
+    when available and permitted, otherwise re-reads idVendor from sysfs.
+    Returns None if the device cannot be resolved.
+    """
+    parts = device_info.split()
+    busnum, devnum = int(parts[1]), int(parts[3].rstrip(":"))
+    vid, pid = parts[5].lower().split(":")
+
+    if _usb_core is not None:
+        try:
+            dev = _usb_core.find(idVendor=int(vid, 16), idProduct=int(pid, 16),
+                                 bus=busnum, address=devnum)
+            if dev is not None:
+                # デバイスディスクリプタ (18 バイト) の取得
+                probe = lambda: dev.ctrl_transfer(0x80, 0x06, 0x0100, 0, 18)
+                probe()
+                return probe
+        except Exception:
+            pass  # 権限が無い等の場合は sysfs にフォールバック
+
+    path = find_sysfs_usb_device(busnum, devnum)
+    if path is None:
+        return None
+    vendor_file = os.path.join(path, "idVendor")
+
+    def probe():
+        if _read_sysfs(vendor_file).lower() != vid:
+            raise OSError(f"device at {path} no longer reports vendor {vid}")
+    return probe
+
+@dataclass(slots=True)
+class DevResult:
+    """Per-device test counters; each record is updated only by its own worker thread."""
+    name: str                 # mountpoint or lsusb line
+    success: int = 0
+    fail: int = 0
+    usb_version: str = ""     # non-storage devices only
 
 def create_test_file(file_path, text="Sample text for USB transfer verification. " * 2):
     """
@@ -25,10 +111,18 @@ def calculate_hash(file_path):
     Calculate the MD5 hash of a file.
     """
     hash_md5 = hashlib.md5()
+    # スレッドごとに 1 MiB のバッファを 1 つだけ持ち、readinto で読み込みごとの確保を避ける
+    buf = getattr(_hash_local, "buf", None)
+    if buf is None:
+        buf = _hash_local.buf = bytearray(HASH_BUF_SIZE)
+    view = memoryview(buf)
     try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
+        with open(file_path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                hash_md5.update(view[:n])
         return hash_md5.hexdigest()
     except Exception as e:
         print(f"[ERROR] Failed to calculate hash for {file_path}: {e}")
@@ -45,9 +139,13 @@ class StorageTest:
         self.usb_devices = []      # List of USB device strings (from lsusb)
         self.storage_devices = []  # List of storage device mountpoints (from lsblk)
         self.device_error_reported = {}  # For each device, to avoid repeated error messages
+        self.usb_versions = {}     # "vid:pid" -> bcdUSB (from a single lsusb -v run)
+        self._executor = None      # デバイス数に合わせたスレッドプール (実行間で再利用)
+        self._executor_workers = 0
+        self._source_bytes = None  # コピー元テストファイルの内容 (実行ごとに 1 回読む)
 
         # Dictionary to store test results.
-        # Format: {"storage": [(mountpoint, success, fail)], "non_storage": [(device_info, success, fail, usb_version)]}
+        # Format: {"storage": [DevResult], "non_storage": [DevResult]}
         self.test_results = {"storage": [], "non_storage": []}
 
     def _update_status(self, message):
@@ -56,6 +154,17 @@ class StorageTest:
         else:
             print(message)
 
+    def _report_progress(self, progress_callback, index, start_time, duration, last_report_t):
+        """
+        進捗の通知を PROGRESS_INTERVAL 秒に 1 回へ間引く。
+        最後に通知した時刻を返す。
+        """
+        now = time.time()
+        if now - last_report_t < PROGRESS_INTERVAL:
+            return last_report_t
+        progress_callback(index, min((now - start_time) / duration * 100, 100))
+        return now
+
     def detect_usb_devices(self):
         """
         Detect USB devices using lsusb and storage devices (mountpoints) using lsblk.
@@ -71,9 +180,21 @@ class StorageTest:
             self._update_status(f"[INFO] Detected USB devices: {self.usb_devices}")
         except Exception as e:
             self._update_status(f"[ERROR] lsusb failed: {e}")
+
+        # USB バージョンはデバイスごとに lsusb -v -d を起動せず、lsusb -v 1 回の出力から引く
+        self.usb_versions = {}
+        try:
+            result = subprocess.run(["lsusb", "-v"], capture_output=True, text=True)
+            for block in _LSUSB_BUS_RE.split(result.stdout):
+                m_id = _USB_ID_RE.search(block)
+                m_ver = _BCDUSB_RE.search(block)
+                if m_id and m_ver:
+                    self.usb_versions.setdefault(m_id.group(1).lower(), m_ver.group(1))
+        except Exception as e:
+            self._update_status(f"[WARN] lsusb -v failed: {e}")
         
         try:
-            lsblk_output = subprocess.check_output("lsblk -o NAME,MOUNTPOINT,SIZE,TYPE -J", shell=True).decode('utf-8')
+            lsblk_output = subprocess.check_output(["lsblk", "-o", "NAME,MOUNTPOINT,SIZE,TYPE", "-J"], text=True)
             data = json.loads(lsblk_output)
             for dev in data.get("blockdevices", []):
                 if dev.get("children"):
@@ -82,18 +203,22 @@ class StorageTest:
                         if mp and mp.startswith("/media/"):
                             self.storage_devices.append(mp)
                             self._update_status(f"[DEBUG] Detected storage device at mountpoint: {mp}")
-            if not self.storage_devices:
-                lsblk_text = subprocess.check_output("lsblk -o NAME,MOUNTPOINT,SIZE,TYPE", shell=True).decode('utf-8')
-                for line in lsblk_text.splitlines():
-                    if '/media/' in line and 'part' in line:
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            mp = parts[1]
-                            self.storage_devices.append(mp)
-                            self._update_status(f"[DEBUG] Detected storage device at mountpoint: {mp}")
         except Exception as e:
             self._update_status(f"[ERROR] lsblk failed: {e}")
 
+        # 見つからなければ lsblk を再度起動せず /proc/mounts を直接読む
+        if not self.storage_devices:
+            try:
+                with open("/proc/mounts") as f:
+                    for line in f:
+                        dev, mp, _ = line.split(maxsplit=2)
+                        mp = mp.replace("\\040", " ")  # /proc/mounts は空白を \040 でエスケープする
+                        if dev.startswith("/dev/") and mp.startswith("/media/"):
+                            self.storage_devices.append(mp)
+                            self._update_status(f"[DEBUG] Detected storage device at mountpoint: {mp}")
+            except Exception as e:
+                self._update_status(f"[ERROR] /proc/mounts read failed: {e}")
+
     def run_storage_test(self, progress_callback, duration=300):
         """
         Run tests on all detected USB devices.
@@ -104,43 +229,57 @@ class StorageTest:
         At the end, outputs a summary via _update_status.
         """
         self._update_status("[INFO] Starting storage test...")
-        source_file = "/tmp/test_file.txt"
+        source_file = os.path.join(TEST_FILE_DIR, "test_file.txt")
         create_test_file(source_file)
+        try:
+            with open(source_file, "rb") as f:
+                self._source_bytes = f.read()
+        except OSError:
+            self._source_bytes = None
         self.test_results = {"storage": [], "non_storage": []}
         self.device_error_reported = {}
 
-        with ThreadPoolExecutor() as executor:
-            futures = []
-            for idx, mountpoint in enumerate(self.storage_devices):
+        # 既定の min(32, cpu+4) スレッドではなくデバイス数ぶんだけ確保し、次回以降も使い回す
+        n_devices = max(1, len(self.storage_devices) + len(self.usb_devices))
+        if self._executor is None or self._executor_workers != n_devices:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=n_devices)
+            self._executor_workers = n_devices
+        executor = self._executor
+        futures = []
+        for idx, mountpoint in enumerate(self.storage_devices):
+            futures.append(executor.submit(
+                self.perform_storage_test, idx, mountpoint, source_file, progress_callback, duration))
+        for idx, device_info in enumerate(self.usb_devices):
+            # 単純な方法：もしストレージデバイスが1件なら、最初のUSBデバイスをストレージとして扱う
+            if self.storage_devices and idx == 0:
+                continue  # 既にストレージテストは行われるので除外
+            else:
                 futures.append(executor.submit(
-                    self.perform_storage_test, idx, mountpoint, source_file, progress_callback, duration))
-            for idx, device_info in enumerate(self.usb_devices):
-                # 単純な方法：もしストレージデバイスが1件なら、最初のUSBデバイスをストレージとして扱う
-                if self.storage_devices and idx == 0:
-                    continue  # 既にストレージテストは行われるので除外
-                else:
-                    futures.append(executor.submit(
-                        self.perform_non_storage_response_test, idx, device_info, progress_callback, duration))
-            for future in futures:
-                future.result()
+                    self.perform_non_storage_response_test, idx, device_info, progress_callback, duration))
+        done, _ = wait(futures)
+        for future in done:
+            future.result()  # ワーカー内の例外はここで再送出
         try:
             os.remove(source_file)
         except Exception as e:
             self._update_status(f"[ERROR] Failed to remove test file: {e}")
         
-        summary = "[SUMMARY] Storage Test Results:\n"
+        parts = ["[SUMMARY] Storage Test Results:\n"]
         if self.test_results["storage"]:
-            summary += "Storage Devices:\n"
-            for mp, succ, fail in self.test_results["storage"]:
-                summary += f"  Mountpoint {mp}: {succ} successes, {fail} failures.\n"
+            parts.append("Storage Devices:\n")
+            parts.extend(f"  Mountpoint {r.name}: {r.success} successes, {r.fail} failures.\n"
+                         for r in self.test_results["storage"])
         else:
-            summary += "No storage devices tested.\n"
+            parts.append("No storage devices tested.\n")
         if self.test_results["non_storage"]:
-            summary += "Non-Storage USB Devices:\n"
-            for info, succ, fail, usb_version in self.test_results["non_storage"]:
-                summary += f"  Device Info: {info}\n    Success: {succ}, Failures: {fail}\n    USB Version: {usb_version}\n"
+            parts.append("Non-Storage USB Devices:\n")
+            parts.extend(f"  Device Info: {r.name}\n    Success: {r.success}, Failures: {r.fail}\n    USB Version: {r.usb_version}\n"
+                         for r in self.test_results["non_storage"])
         else:
-            summary += "No non-storage devices tested.\n"
+            parts.append("No non-storage devices tested.\n")
+        summary = "".join(parts)
         self._update_status(summary)
         return summary
 
@@ -151,74 +290,83 @@ class StorageTest:
         Records results in self.test_results["storage"].
         """
         target_file = os.path.join(mountpoint, "test_copy.txt")
-        success_count = 0
-        fail_count = 0
+        res = DevResult(mountpoint)
+        self.test_results["storage"].append(res)
         start_time = time.time()
+        last_report_t = 0.0
         while time.time() - start_time < duration:
-            if self.stop_event.is_set():
+            if self.stop_event.wait(timeout=0.0):
                 break
             try:
-                subprocess.check_call(f"cp {source_file} {target_file}", shell=True)
-                source_hash = calculate_hash(source_file)
-                target_hash = calculate_hash(target_file)
-                if source_hash and target_hash and source_hash == target_hash:
-                    success_count += 1
+                # cp を起動せず、プロセス内でコピーする (Linux では sendfile が使われる)
+                shutil.copyfile(source_file, target_file)
+                # 100 バイトのファイルなのでハッシュは取らず、内容を直接比較する。
+                # コピー元の内容は実行開始時に 1 回だけ読んだものを使う
+                if self._source_bytes is not None:
+                    with open(target_file, "rb") as f:
+                        matched = f.read(len(self._source_bytes) + 1) == self._source_bytes
+                else:
+                    filecmp.clear_cache()
+                    matched = filecmp.cmp(source_file, target_file, shallow=False)
+                if matched:
+                    res.success += 1
                 else:
-                    fail_count += 1
+                    res.fail += 1
                 os.remove(target_file)
             except Exception as e:
-                fail_count += 1
+                res.fail += 1
                 if "Permission denied" in str(e):
                     self._update_status(f"[ERROR] Storage test on {mountpoint} failed: Permission denied. Ensure the device is formatted with proper user permissions.")
                     break
                 else:
                     self._update_status(f"[ERROR] Storage test failed on device {index+1}: {e}")
-            progress = (time.time() - start_time) / duration * 100
-            progress_callback(index, progress)
-            time.sleep(1)
-        self.test_results["storage"].append((mountpoint, success_count, fail_count))
-        self._update_status(f"[INFO] Storage test on {mountpoint} completed: {success_count} successes, {fail_count} failures.")
+                    # デバイスが抜けた等で失敗が続くと全速で空回りしてログが溢れるため、失敗時だけ間を置く
+                    if self.stop_event.wait(timeout=ERROR_BACKOFF):
+                        break
+            last_report_t = self._report_progress(progress_callback, index, start_time, duration, last_report_t)
+        self._update_status(f"[INFO] Storage test on {mountpoint} completed: {res.success} successes, {res.fail} failures.")
 
     def perform_non_storage_response_test(self, index, device_info, progress_callback, duration=300):
         """
-        For non-storage USB devices: perform a response test by simulating a 50ms delay.
+        For non-storage USB devices: perform a response test by probing the device
+        every RESPONSE_INTERVAL seconds (see make_usb_probe).
         Also, attempt to retrieve USB version info from lsusb output.
         Records results in self.test_results["non_storage"].
         """
         start_time = time.time()
-        success_count = 0
-        fail_count = 0
-        usb_version = "Unknown"
+        res = DevResult(device_info, usb_version="Unknown")
+        self.test_results["non_storage"].append(res)
         try:
-            device_id = device_info.split()[5]  # e.g., "0930:6544"
-            cmd = f"lsusb -v -d {device_id}"
-            output = subprocess.check_output(cmd, shell=True).decode('utf-8')
-            m = re.search(r"bcdUSB\s+([\d\.]+)", output)
-            if m:
-                usb_version = m.group(1)
-            else:
-                usb_version = "Not found"
+            device_id = device_info.split()[5].lower()  # e.g., "0930:6544"
+            if self.usb_versions:
+                res.usb_version = self.usb_versions.get(device_id, "Not found")
         except Exception as e:
-            usb_version = f"Error: {e}"
-            if device_id not in self.device_error_reported:
+            res.usb_version = f"Error: {e}"
+            if device_info not in self.device_error_reported:
                 self._update_status(f"[WARN] Failed to retrieve USB info for device: {device_info}. {e}")
-                self.device_error_reported[device_id] = True
-        while time.time() - start_time < duration:
-            if self.stop_event.is_set():
-                break
+                self.device_error_reported[device_info] = True
+        try:
+            probe = make_usb_probe(device_info)
+        except Exception as e:
+            probe = None
+            self._update_status(f"[WARN] Failed to resolve USB device {device_info}: {e}")
+        if probe is None:
+            res.fail += 1
+            self._update_status(f"[ERROR] Response test: device {index+1} not found: {device_info}")
+        last_report_t = 0.0
+        while probe is not None and time.time() - start_time < duration:
             try:
-                time.sleep(0.05)
-                success_count += 1
+                probe()
+                res.success += 1
             except Exception as e:
-                fail_count += 1
+                res.fail += 1
                 self._update_status(f"[ERROR] Response test failed for device {index+1}: {e}")
-            progress = (time.time() - start_time) / duration * 100
-            progress_callback(index, progress)
-            time.sleep(1)
-        self.test_results["non_storage"].append((device_info, success_count, fail_count, usb_version))
+            last_report_t = self._report_progress(progress_callback, index, start_time, duration, last_report_t)
+            if self.stop_event.wait(timeout=RESPONSE_INTERVAL):
+                break
         result_msg = (f"[INFO] Response test for device {index+1} completed:\n"
-                      f"Device Info: {device_info}\nSuccess: {success_count}, Failures: {fail_count}\n"
-                      f"USB Version: {usb_version}")
+                      f"Device Info: {device_info}\nSuccess: {res.success}, Failures: {res.fail}\n"
+                      f"USB Version: {res.usb_version}")
         self._update_status(result_msg)
 
     def stop_test(self):
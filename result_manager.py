@@ -44,13 +44,14 @@ def show_summary_window(app):
             text="Failed Tests:",
             font=(None, 12, "bold")
         ).pack(anchor="w")
-        for name in failures:
-            ttk.Label(
-                frame,
-                text=f" - {name}",
-                foreground=_COLORS.get("FAIL"),
-                font=(None, 12)
-            ).pack(anchor="w", padx=10)
+        # 失敗テストは 1 つのラベルにまとめ、配置計算を 1 回で済ませる
+        ttk.Label(
+            frame,
+            text="\n".join(f" - {name}" for name in failures),
+            foreground=_COLORS.get("FAIL"),
+            font=(None, 12),
+            justify="left"
+        ).pack(anchor="w", padx=10)
     else:
         ttk.Label(
             frame,
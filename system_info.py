@@ -2,55 +2,153 @@
 import subprocess
 import platform
 import re
+import time
+import functools
+import threading
+import atexit
 import torch
 
+def _ttl_cache(ttl):
+    """
+    引数を取らない情報取得関数の結果を ttl 秒間キャッシュするデコレータ。
+    毎回のサブプロセス起動を避けるために使う。
+    """
+    def deco(fn):
+        last = [0.0, None]  # [取得時刻, 結果]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            now = time.monotonic()
+            if last[1] is None or now - last[0] > ttl:
+                last[1] = fn(*args, **kwargs)
+                last[0] = now
+            return last[1]
+        return wrapper
+    return deco
+
+@functools.lru_cache(maxsize=1)
 def get_cpu_info():
     """
     lscpu コマンド等を使って CPU 情報を取得し、
     脆弱性関連行 (Vulnerability ...) は表示しないようにする例。
+    CPU 構成は実行中に変わらないため、取得は初回の 1 回だけ行う。
+    lscpu が使えない環境では /proc/cpuinfo から要約を作る。
     """
     try:
         output = subprocess.check_output(["lscpu"], stderr=subprocess.STDOUT, universal_newlines=True)
-        lines = output.strip().splitlines()
-        filtered_lines = []
-        for line in lines:
-            # 'Vulnerability' を含む行を除外する
-            if "Vulnerability" in line:
-                continue
-            filtered_lines.append(line)
-        return "\n".join(filtered_lines)
+        # 'Vulnerability' を含む行を除外する
+        return "\n".join(line for line in output.strip().splitlines() if "Vulnerability" not in line)
     except Exception as e:
-        return f"CPU Info error: {e}"
+        lscpu_error = e
+    try:
+        with open("/proc/cpuinfo") as f:
+            cpuinfo = f.read()
+        model = re.search(r"^model name\s*:\s*(.+)$", cpuinfo, re.M)
+        n_cpus = len(re.findall(r"^processor\s*:", cpuinfo, re.M))
+        return f"Model name: {model.group(1) if model else 'unknown'}\nCPU(s): {n_cpus}"
+    except Exception:
+        return f"CPU Info error: {lscpu_error}"
+
+@functools.lru_cache(maxsize=1)
+def _gpu_backend():
+    """ROCm / CUDA の判定結果 ("rocm" / "cuda" / None)。実行中は変わらないため 1 回だけ判定する。"""
+    if hasattr(torch.version, 'hip') and torch.version.hip is not None:
+        return "rocm"
+    if torch.version.cuda is not None:
+        return "cuda"
+    return None
+
+# nvidia-smi は -l 1 で常駐させ、1 秒ごとに出力される行をバックグラウンドで読み続ける。
+# GPU 情報と消費電力は同じ行から取り出す
+_NVSMI_FIELDS = "index,utilization.gpu,utilization.memory,memory.total,memory.free,memory.used,power.draw"
+_nvsmi_lock = threading.Lock()
+_nvsmi_rows = {}      # GPU index -> 最新の CSV 行 (index 以外の列)
+_nvsmi_proc = None
+# すぐ落ちる環境 (ドライバ不整合など) で毎回起動し直さないよう、再起動は間隔を広げつつ回数を制限する
+_NVSMI_MAX_RESTARTS = 5
+_NVSMI_RESTART_BACKOFF = 2.0   # 初回の再起動待ち (秒)。失敗のたびに倍にする
+_nvsmi_restarts = 0
+_nvsmi_next_spawn = 0.0
+
+def _nvsmi_shutdown():
+    proc = _nvsmi_proc
+    if proc is not None and proc.poll() is None:
+        proc.terminate()
 
+atexit.register(_nvsmi_shutdown)
+
+def _nvsmi_reader(proc):
+    for line in proc.stdout:
+        fields = [f.strip() for f in line.split(",")]
+        if len(fields) != _NVSMI_FIELDS.count(",") + 1:
+            continue
+        with _nvsmi_lock:
+            _nvsmi_rows[fields[0]] = fields[1:]
+
+def _nvsmi_latest():
+    """
+    常駐 nvidia-smi の最新値を GPU 順の行リストで返す。
+    常駐プロセスが起動できない・終了した場合は 1 回だけ問い合わせる。
+    """
+    global _nvsmi_proc, _nvsmi_restarts, _nvsmi_next_spawn
+    with _nvsmi_lock:
+        running = _nvsmi_proc is not None and _nvsmi_proc.poll() is None
+        if not running:
+            _nvsmi_rows.clear()
+        now = time.monotonic()
+        if (not running and _nvsmi_restarts <= _NVSMI_MAX_RESTARTS
+                and now >= _nvsmi_next_spawn):
+            if _nvsmi_proc is not None:
+                # 常駐プロセスが落ちた後の再起動。上限を超えたら以降は 1 回問い合わせのみ
+                _nvsmi_restarts += 1
+            _nvsmi_next_spawn = now + _NVSMI_RESTART_BACKOFF * (2 ** _nvsmi_restarts)
+            if _nvsmi_restarts <= _NVSMI_MAX_RESTARTS:
+                try:
+                    _nvsmi_proc = subprocess.Popen(
+                        ["nvidia-smi", "--format=csv,noheader,nounits",
+                         f"--query-gpu={_NVSMI_FIELDS}", "-l", "1"],
+                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                        universal_newlines=True, bufsize=1
+                    )
+                    threading.Thread(target=_nvsmi_reader, args=(_nvsmi_proc,), daemon=True).start()
+                except OSError:
+                    # nvidia-smi 自体が無い。起動し直しても無駄なので常駐はやめる
+                    _nvsmi_restarts = _NVSMI_MAX_RESTARTS + 1
+        rows = [_nvsmi_rows[k] for k in sorted(_nvsmi_rows, key=int)]
+    if rows:
+        return rows
+    # 常駐プロセスの最初の出力が届く前は 1 回だけ直接問い合わせる
+    output = subprocess.check_output(
+        ["nvidia-smi", "--format=csv,noheader,nounits", f"--query-gpu={_NVSMI_FIELDS}"],
+        stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    return [[f.strip() for f in line.split(",")][1:] for line in output.strip().splitlines()]
+
+@_ttl_cache(10)
+def _rocm_smi_output():
+    """温度・メモリ使用率・GPU 使用率・消費電力を rocm-smi の 1 回の起動でまとめて取得する。"""
+    cmd = ["rocm-smi", "--showtemp", "--showmemuse", "--showuse", "--showpower"]
+    return subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+
+@_ttl_cache(1)
 def get_gpu_info():
     """
     ROCm 環境か CUDA(NVIDIA) 環境かを判別して GPU 情報を取得。
     - ROCm → rocm-smi
-    - CUDA → nvidia-smi
+    - CUDA → nvidia-smi (常駐プロセスの最新値)
     - どちらでもない場合は "No GPU or unknown environment" とする。
     """
-    # ROCm 判定
-    if hasattr(torch.version, 'hip') and torch.version.hip is not None:
-        # ROCm 環境
+    backend = _gpu_backend()
+    if backend == "rocm":
         try:
-            # rocm-smi のバージョンによりオプションが異なるかもしれないので注意
-            # 例として temp と usage を取る
-            cmd = ["rocm-smi", "--showtemp", "--showmemuse", "--showuse"]
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
-            return f"ROCm GPU Info:\n{output}"
+            return f"ROCm GPU Info:\n{_rocm_smi_output()}"
         except Exception as e:
             return f"ROCm GPU Info error: {e}"
-    # CUDA 判定
-    elif torch.version.cuda is not None:
-        # NVIDIA CUDA 環境
+    elif backend == "cuda":
         try:
-            cmd = [
-                "nvidia-smi",
-                "--format=csv,noheader,nounits",
-                "--query-gpu=utilization.gpu,utilization.memory,memory.total,memory.free,memory.used"
-            ]
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
-            # 例としてそのまま返す
+            # utilization.gpu, utilization.memory, memory.total, memory.free, memory.used
+            rows = _nvsmi_latest()
+            output = "".join(", ".join(row[:5]) + "\n" for row in rows)
             return f"NVIDIA GPU Info:\n{output}"
         except Exception as e:
             return f"NVIDIA GPU Info error: {e}"
@@ -58,33 +156,50 @@ def get_gpu_info():
         # どちらでもない
         return "No GPU or unknown environment"
 
+@_ttl_cache(1)
 def get_psu_power():
     """
     PSU Power (消費電力) 表示の例。
-    CUDA 環境 → nvidia-smi で Power Draw 取得
-    ROCm 環境 → rocm-smi で平均消費電力 (AvgPwr) 等を取得
+    CUDA 環境 → nvidia-smi (常駐プロセス) の Power Draw
+    ROCm 環境 → rocm-smi の出力から消費電力の行を取り出す
     """
-    # ROCm 判定
-    if hasattr(torch.version, 'hip') and torch.version.hip is not None:
+    backend = _gpu_backend()
+    if backend == "rocm":
         try:
-            # rocm-smi --showpower など
-            cmd = ["rocm-smi", "--showpower"]
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
-            # 必要に応じてパース
-            return f"PSU Power (ROCm):\n{output}"
+            output = _rocm_smi_output()
+            power_lines = [line for line in output.splitlines() if "Power" in line]
+            return "PSU Power (ROCm):\n" + "\n".join(power_lines or output.splitlines())
         except Exception as e:
             return f"PSU Power (ROCm) error: {e}"
-    elif torch.version.cuda is not None:
+    elif backend == "cuda":
         try:
-            # nvidia-smi で Power Draw を取得
-            cmd = [
-                "nvidia-smi",
-                "--format=csv,noheader,nounits",
-                "--query-gpu=power.draw"
-            ]
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
-            return f"PSU Power (CUDA): {output.strip()} W"
+            draws = "\n".join(row[5] for row in _nvsmi_latest())
+            return f"PSU Power (CUDA): {draws} W"
         except Exception as e:
             return f"PSU Power (CUDA) error: {e}"
     else:
         return "No GPU environment - PSU power unknown"
+
+_ROCM_VRAM_RE = re.compile(r"VRAM%\)?\s*:\s*([\d.]+)")
+
+@_ttl_cache(1)
+def get_vram_usage():
+    """
+    全 GPU を合わせた VRAM 使用率 (%) を返す。取得できなければ None。
+    デバイス全体の値を smi から読むため、子プロセスで確保された分も含まれ、
+    このプロセスに CUDA/HIP コンテキストを作らない。
+    """
+    backend = _gpu_backend()
+    try:
+        if backend == "rocm":
+            values = [float(v) for v in _ROCM_VRAM_RE.findall(_rocm_smi_output())]
+            return sum(values) / len(values) if values else None
+        if backend == "cuda":
+            # memory.total, memory.used (MiB)
+            rows = _nvsmi_latest()
+            total = sum(float(row[2]) for row in rows)
+            used = sum(float(row[4]) for row in rows)
+            return used / total * 100 if total > 0 else None
+    except Exception as e:
+        print(f"VRAM usage error: {e}")
+    return None
@@ -1,5 +1,6 @@
-import threading
+import time
 import multiprocessing
+from concurrent.futures import wait
 
 def run_cpu_load_wrapper(cpu_func, cpu_load_percentage, stop_event):
     # CPU負荷テスト呼び出し
@@ -12,12 +13,9 @@ def run_gpu_load_wrapper(gpu_func, gpu_load_percentage, gpu_ids, stop_event):
 
 
 def stop_all_tests(app):
-    # すべての stop_event をセット
-    for ev in getattr(app,'__dict__',{}):
-        if ev.endswith('_stop_event') and app.__dict__[ev]:
-            app.__dict__[ev].set()
-    # join 
-    threading.Thread(target=lambda: None,daemon=True).start()
+    # 生成時に app.stop_events へ登録された stop_event をすべてセット
+    for ev in getattr(app, 'stop_events', ()):
+        ev.set()
 
 
 def join_all_threads(app):
@@ -25,17 +23,26 @@ def join_all_threads(app):
     for t in (app.storage_test_thread, app.sound_test_thread, app.network_test_thread):
         if t:
             threads.append(t)
+    # 全体で 1 つの期限を設け、残り時間だけ待つ (詰まったスレッドが複数でも最大 5 秒)
+    deadline = time.monotonic() + 5
     for th in threads:
         if th.is_alive():
-            th.join(timeout=5)
-    # プロセス停止
-    for p in app.cpu_processes:
-        if p.is_alive():
-            p.terminate()
-            p.join(timeout=5)
+            th.join(timeout=max(0, deadline - time.monotonic()))
+    futures = getattr(app, 'gpu_futures', [])
+    for fut in futures:
+        fut.cancel()
+    wait(futures, timeout=max(0, deadline - time.monotonic()))
+    # プロセス停止: 先にまとめて terminate してから同じく期限付きで join
+    alive = [p for p in app.cpu_processes if p.is_alive()]
+    for p in alive:
+        p.terminate()
+    deadline = time.monotonic() + 5
+    for p in alive:
+        p.join(timeout=max(0, deadline - time.monotonic()))
+    multiprocessing.active_children()  # 終了済みの子プロセスを回収
 
     # クリア
-    app.cpu_threads.clear(); app.cpu_processes.clear(); app.gpu_threads.clear()
+    app.cpu_threads.clear(); app.cpu_processes.clear(); app.gpu_threads.clear(); futures.clear()
     app.storage_test_thread = None; app.sound_test_thread = None; app.network_test_thread = None
 
     app.root.after(0, lambda: app.update_status("\nAll tests stopped.\n"))
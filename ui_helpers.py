@@ -1,11 +1,28 @@
 import tkinter as tk
+from tkinter.scrolledtext import ScrolledText
+
+# 進捗ポップアップに残す最大行数（長時間の Burn-in でも Text の描画コストを一定に保つ）
+POPUP_MAX_LINES = 2000
+
+
+class CappedScrolledText(ScrolledText):
+    """insert のたびに古い行を削り、最新 max_lines 行だけを保持する ScrolledText。"""
+
+    def __init__(self, master=None, max_lines=POPUP_MAX_LINES, **kw):
+        super().__init__(master, **kw)
+        self.max_lines = max_lines
+
+    def insert(self, index, chars, *args):
+        super().insert(index, chars, *args)
+        if int(self.index("end-1c").split(".")[0]) > self.max_lines:
+            self.delete("1.0", f"end-{self.max_lines}l")
 
 
 def create_burnin_popup(root):
     popup = tk.Toplevel(root)
     popup.title("Burn-in Test Progress")
     popup.geometry("600x400")
-    txt = tk.Text(popup, height=20, width=70)
+    txt = CappedScrolledText(popup, height=20, width=70)
     txt.pack(padx=10, pady=10)
     return popup, txt
 
@@ -14,6 +31,6 @@ def create_net_popup(root):
     popup = tk.Toplevel(root)
     popup.title("Network Test Progress")
     popup.geometry("400x300")
-    txt = tk.Text(popup, height=15, width=50)
+    txt = CappedScrolledText(popup, height=15, width=50)
     txt.pack(padx=10, pady=10)
     return popup, txt
@@ -0,0 +1,111 @@
+"""
+CUDA 仮想メモリ管理 (VMM) API を使った VRAM 負荷。
+
+cuMemAddressReserve で連続した仮想アドレス範囲を 1 つ予約し、cuMemCreate で作った
+固定サイズの物理チャンクを cuMemMap で並べて割り当てる。キャッシングアロケータの
+セグメントを介さないため、確保と解放を繰り返してもプールが断片化しない。
+
+環境変数 POWERLOADER_USE_VMM=1 かつ cuda-python が入っている場合のみ使用する。
+"""
+import os
+import threading
+
+try:
+    from cuda import cuda  # 任意依存 (cuda-python)
+except ImportError:
+    cuda = None
+
+# チャンクごとの cuMemCreate/cuMemMap のコストを抑えるため、粒度 (通常 2 MiB) ではなく大きめに取る
+VMM_CHUNK_SIZE = 256 * 1024 * 1024
+
+
+def vmm_enabled():
+    return cuda is not None and os.environ.get("POWERLOADER_USE_VMM") == "1"
+
+
+def _check(result):
+    """cuda-python の (CUresult, 値...) を展開し、エラーなら例外にする。"""
+    err, *values = result
+    if err != cuda.CUresult.CUDA_SUCCESS:
+        raise RuntimeError(f"CUDA driver error: {err}")
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else tuple(values)
+
+
+def hold_vram_vmm(load_percentage, stop_event, gpu_id):
+    """
+    gpu_id の全 VRAM の load_percentage % を VMM で確保し、stop_event がセットされるまで保持する。
+    """
+    # 途中で失敗しても作った分だけ後始末できるよう、確保したものを順に記録する
+    dev = ctx = None
+    base = reserved = 0
+    handles = []
+    mapped_chunks = 0
+    try:
+        _check(cuda.cuInit(0))
+        dev = _check(cuda.cuDeviceGet(gpu_id))
+        ctx = _check(cuda.cuDevicePrimaryCtxRetain(dev))
+        _check(cuda.cuCtxSetCurrent(ctx))
+
+        prop = cuda.CUmemAllocationProp()
+        prop.type = cuda.CUmemAllocationType.CU_MEM_ALLOCATION_TYPE_PINNED
+        prop.location.type = cuda.CUmemLocationType.CU_MEM_LOCATION_TYPE_DEVICE
+        prop.location.id = gpu_id
+        granularity = _check(cuda.cuMemGetAllocationGranularity(
+            prop, cuda.CUmemAllocationGranularity_flags.CU_MEM_ALLOC_GRANULARITY_MINIMUM))
+        chunk_size = max(granularity, VMM_CHUNK_SIZE // granularity * granularity)
+
+        _, total = _check(cuda.cuMemGetInfo())
+        n_chunks = int(total * load_percentage / 100) // chunk_size
+        if n_chunks == 0:
+            return
+        base = int(_check(cuda.cuMemAddressReserve(n_chunks * chunk_size, 0, 0, 0)))
+        reserved = n_chunks * chunk_size
+
+        for i in range(n_chunks):
+            if stop_event.is_set():
+                break
+            try:
+                handle = _check(cuda.cuMemCreate(chunk_size, prop, 0))
+            except RuntimeError as e:
+                # 空きが足りなければ確保できた分だけで負荷を維持する
+                print(f"[GPU {gpu_id}] VMM chunk {i} allocation failed: {e}")
+                break
+            handles.append(handle)
+            _check(cuda.cuMemMap(base + i * chunk_size, chunk_size, 0, handle, 0))
+            mapped_chunks += 1
+
+        mapped = mapped_chunks * chunk_size
+        if mapped:
+            access = cuda.CUmemAccessDesc()
+            access.location = prop.location
+            access.flags = cuda.CUmemAccess_flags.CU_MEM_ACCESS_FLAGS_PROT_READWRITE
+            _check(cuda.cuMemSetAccess(base, mapped, [access], 1))
+            # 物理ページへ実際に書き込んでおく
+            _check(cuda.cuMemsetD8(base, 0xA5, mapped))
+            _check(cuda.cuCtxSynchronize())
+        print(f"[GPU {gpu_id}] VMM holding {mapped / (1024**3):.2f} GB in {mapped_chunks} chunks")
+        stop_event.wait()
+    finally:
+        # マップ済みのチャンクだけ unmap し、作成済みのハンドルは map 失敗分も含めて解放する
+        for i in range(mapped_chunks):
+            cuda.cuMemUnmap(base + i * chunk_size, chunk_size)
+        for handle in handles:
+            cuda.cuMemRelease(handle)
+        if reserved:
+            cuda.cuMemAddressFree(base, reserved)
+        if ctx is not None:
+            cuda.cuDevicePrimaryCtxRelease(dev)
+        if reserved:
+            print(f"[GPU {gpu_id}] VMM VRAM released")
+
+
+def apply_gpu_vram_load_vmm(load_percentage, stop_event, gpu_ids):
+    print(f"Starting GPU VRAM Load (VMM) with {load_percentage}% on GPUs: {gpu_ids}")
+    for gpu_id in gpu_ids:
+        threading.Thread(
+            target=hold_vram_vmm,
+            args=(load_percentage, stop_event, gpu_id),
+            daemon=True
+        ).start()